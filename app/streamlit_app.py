@@ -2,8 +2,6 @@
 # app/streamlit_app.py (updated with YouTube URL fetch)
 import streamlit as st
 import pandas as pd
-import numpy as np
-import joblib
 import os
 import sys
 import traceback
@@ -11,8 +9,11 @@ import traceback
 # Add parent directory to path so we can import src
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.data_processing import feature_engineering
-from src.youtube_fetch import extract_video_id, fetch_video_metadata, fetch_channel_subscribers, build_feature_row_from_video, fetch_category_map
+from src.serving import Predictor, RemotePredictor
+from src.prediction_cache import PredictionCache
+from src.youtube_fetch import extract_video_id, enrich_videos, shared_category_maps, DEFAULT_COUNTRY
+from src import instrumentation
+from src.instrumentation import profile_block, timer
 
 st.set_page_config(page_title='YouTube Revenue Predictor', layout='centered')
 st.title('YouTube Ad Revenue Predictor')
@@ -20,24 +21,61 @@ st.markdown('Predict YouTube ad revenue from video metadata. You can either fetc
 
 MODEL_PATH = os.environ.get('MODEL_PATH', 'models/best_model.joblib')
 YT_API_KEY = os.environ.get('YT_API_KEY')
-
-@st.cache_data
-def load_model_bundle(path):
+# When set, predictions are served by `python serve.py` instead of in-process
+PREDICTION_SERVICE_URL = os.environ.get('PREDICTION_SERVICE_URL')
+COUNTRIES = ['US', 'IN', 'BR', 'GB', 'JP', 'Other']
+DEVICES = ['Mobile', 'Desktop', 'Tablet', 'Smart TV']
+
+# One set of category maps per server process, fetched for YT_CATEGORY_REGIONS in a
+# single concurrent burst at startup and refreshed in the background, not per request
+@st.cache_resource
+def _warm_category_maps():
+    return shared_category_maps(YT_API_KEY).warm()
+
+if YT_API_KEY:
+    _warm_category_maps()
+
+# cache_resource keeps one resident predictor per model path for all sessions,
+# instead of hashing and pickling the model on every access
+@st.cache_resource
+def _load_predictor(path):
+    # Repeat requests for the same video skip model.predict; retraining the
+    # bundle on disk invalidates the memo automatically
+    return Predictor(model_path=path, cache=PredictionCache(maxsize=50_000, ttl=3600),
+                     explain_cache=PredictionCache(maxsize=10_000, ttl=3600))
+
+def get_predictor(path):
+    if PREDICTION_SERVICE_URL:
+        return RemotePredictor(PREDICTION_SERVICE_URL)
     try:
-        return joblib.load(path)
+        predictor = _load_predictor(path)
+        st.session_state['predictor_loaded'] = True
+        return predictor
     except FileNotFoundError:
         st.warning(f"⚠️ Model file not found at {path}. Please train the model first by running: python notebook.py")
-        return None
     except Exception as e:
         st.error(f"Error loading model: {e}")
-        return None
-
-@st.cache_data
-def load_category_map(api_key):
-    try:
-        return fetch_category_map(api_key=api_key)
-    except Exception:
-        return {}
+    return None
+
+def show_prediction(pred):
+    st.success(f"Estimated ad revenue (USD): ${pred['prediction']:,.2f}")
+    # Ensemble bundles also return a P10-P90 band
+    if pred.get('p10') is not None and pred.get('p90') is not None:
+        st.caption(f"Likely range (P10-P90): ${pred['p10']:,.2f} - ${pred['p90']:,.2f}")
+
+def show_explanation(predictor, row):
+    # SHAP values need the bundle in-process; the remote service only predicts
+    if not hasattr(predictor, 'explain_rows'):
+        return
+    with st.expander('Why this estimate? (SHAP contributions)'):
+        try:
+            contributions = predictor.explain_rows([row])[0]
+        except Exception as e:
+            st.info(f'No explanation available for this model: {e}')
+            return
+        base = contributions.pop('base_value')
+        st.caption(f'Average model output ${base:,.2f}; each bar moves the estimate up or down from there (USD).')
+        st.bar_chart(pd.Series(contributions).sort_values(key=abs, ascending=False))
 
 st.sidebar.header('Configuration')
 retention_rate = st.sidebar.slider('Estimated average retention (fraction of video watched)', min_value=0.05, max_value=0.9, value=0.30, step=0.05)
@@ -55,6 +93,11 @@ with tab1:
         video_url = st.text_input('YouTube video URL or ID', placeholder='https://www.youtube.com/watch?v=XXXXXXXXXXX', key='url_input')
     with col2:
         fetch_button = st.button('Fetch & Predict', key='fetch_btn')
+    col3, col4 = st.columns(2)
+    with col3:
+        audience_country = st.selectbox('Audience country', options=COUNTRIES, key='fetch_country')
+    with col4:
+        audience_device = st.selectbox('Primary device', options=DEVICES, key='fetch_device')
 
     if fetch_button:
         vid = extract_video_id(video_url)
@@ -62,34 +105,22 @@ with tab1:
             st.error('Could not extract a video id from that input. Paste a full YouTube URL or the 11-char id.')
             st.stop()
 
-        try:
-            bundle = load_model_bundle(model_path_input)
-        except Exception as e:
-            st.error(f'Failed to load model bundle at {model_path_input}: {e}')
-            st.stop()
-
-        model = bundle.get('model')
-        artifacts = bundle.get('artifacts')
-        if model is None or artifacts is None:
-            st.error('Model bundle appears incomplete (needs "model" and "artifacts").')
+        predictor = get_predictor(model_path_input)
+        if predictor is None:
             st.stop()
 
         try:
-            video_meta = fetch_video_metadata(vid, api_key=YT_API_KEY)
-            if video_meta is None:
+            # Video, channel and category lookups run concurrently on a pooled session
+            with timer('app_fetch'), profile_block('app_fetch'):
+                # Category titles come from the audience country's map ('Other' uses the default region)
+                region = audience_country if audience_country != 'Other' else DEFAULT_COUNTRY
+                enriched = enrich_videos([vid], api_key=YT_API_KEY, retention_rate=retention_rate, region_code=region,
+                                         device=audience_device, country=audience_country).get(vid)
+            if enriched is None:
                 st.error('No metadata returned for the video id (video may not exist or may be private).')
                 st.stop()
-
-            subs = None
-            if video_meta.get('channelId'):
-                try:
-                    subs = fetch_channel_subscribers(video_meta['channelId'], api_key=YT_API_KEY)
-                except Exception:
-                    subs = None
-
-            cat_map = load_category_map(YT_API_KEY)
-            feature_row = build_feature_row_from_video(video_meta, retention_rate=retention_rate, category_map=cat_map)
-            feature_row['subscribers'] = subs or 0
+            video_meta = enriched['meta']
+            feature_row = enriched['features']
 
         except Exception as e:
             st.error(f'Failed to fetch video metadata: {e}')
@@ -108,7 +139,7 @@ with tab1:
         }
         st.json(md)
 
-        X_row = pd.DataFrame([{
+        row = {
             'views': feature_row['views'],
             'likes': feature_row['likes'],
             'comments': feature_row['comments'],
@@ -119,33 +150,18 @@ with tab1:
             'device': feature_row['device'],
             'country': feature_row['country'],
             'date': pd.to_datetime(feature_row.get('publishedAt')) if feature_row.get('publishedAt') else pd.to_datetime('today')
-        }])
-
-        X_row = feature_engineering(X_row)
-
-        feat_cols = artifacts['feature_columns']
-        X_feat = pd.DataFrame(0, index=[0], columns=feat_cols)
-
-        for col in X_row.select_dtypes(include=[np.number]).columns:
-            if col in X_feat.columns:
-                X_feat.loc[0, col] = X_row.loc[0, col]
-
-        for cat in ['category', 'device', 'country']:
-            val = X_row.loc[0].get(cat)
-            if pd.isna(val):
-                continue
-            candidates = [c for c in feat_cols if c.startswith(cat + '_')]
-            for cand in candidates:
-                if str(val) in cand or cand.endswith(f"_{val}"):
-                    X_feat.loc[0, cand] = 1
+        }
 
         try:
-            pred = model.predict(X_feat)[0]
-            st.success(f"Estimated ad revenue (USD): ${pred:,.2f}")
+            with timer('app_predict'), profile_block('app_predict'):
+                pred = predictor.predict_rows([row], intervals=True)[0]
+            show_prediction(pred)
+            show_explanation(predictor, row)
             st.write("Note: this is an estimate from a learner model — refine with better watch_time and retention data for improved accuracy.")
         except Exception as e:
             st.error(f'Prediction failed: {e}')
-            st.write('Model expected features:', feat_cols[:20], '...')
+            if isinstance(predictor, Predictor):
+                st.write('Model expected features:', predictor.feature_columns[:20], '...')
 
 with tab2:
     st.subheader('Manual Metrics Entry')
@@ -160,25 +176,17 @@ with tab2:
     with col2:
         subscribers = st.number_input('Channel subscribers', min_value=0, value=10000)
         category = st.selectbox('Category', options=['Gaming', 'Music', 'Education', 'Entertainment', 'Sports', 'Other'])
-        device = st.selectbox('Primary device', options=['Mobile', 'Desktop', 'Tablet', 'Smart TV'])
-        country = st.selectbox('Country', options=['US', 'IN', 'BR', 'GB', 'JP', 'Other'])
+        device = st.selectbox('Primary device', options=DEVICES)
+        country = st.selectbox('Country', options=COUNTRIES)
     
     watch_time_min = video_length_min * retention_rate
     
     if st.button('Predict', key='manual_btn'):
-        try:
-            bundle = load_model_bundle(model_path_input)
-        except Exception as e:
-            st.error(f'Failed to load model bundle at {model_path_input}: {e}')
-            st.stop()
-
-        model = bundle.get('model')
-        artifacts = bundle.get('artifacts')
-        if model is None or artifacts is None:
-            st.error('Model bundle appears incomplete (needs "model" and "artifacts").')
+        predictor = get_predictor(model_path_input)
+        if predictor is None:
             st.stop()
 
-        X_row = pd.DataFrame([{
+        row = {
             'views': views,
             'likes': likes,
             'comments': comments,
@@ -189,29 +197,13 @@ with tab2:
             'device': device,
             'country': country,
             'date': pd.to_datetime('today')
-        }])
-
-        X_row = feature_engineering(X_row)
-
-        feat_cols = artifacts['feature_columns']
-        X_feat = pd.DataFrame(0, index=[0], columns=feat_cols)
-
-        for col in X_row.select_dtypes(include=[np.number]).columns:
-            if col in X_feat.columns:
-                X_feat.loc[0, col] = X_row.loc[0, col]
-
-        for cat in ['category', 'device', 'country']:
-            val = X_row.loc[0].get(cat)
-            if pd.isna(val):
-                continue
-            candidates = [c for c in feat_cols if c.startswith(cat + '_')]
-            for cand in candidates:
-                if str(val) in cand or cand.endswith(f"_{val}"):
-                    X_feat.loc[0, cand] = 1
+        }
 
         try:
-            pred = model.predict(X_feat)[0]
-            st.success(f"Estimated ad revenue (USD): ${pred:,.2f}")
+            with timer('app_predict'), profile_block('app_predict'):
+                pred = predictor.predict_rows([row], intervals=True)[0]
+            show_prediction(pred)
+            show_explanation(predictor, row)
             st.write("**Input metrics:**")
             st.json({
                 'Views': views,
@@ -227,7 +219,28 @@ with tab2:
             })
         except Exception as e:
             st.error(f'Prediction failed: {e}')
-            st.write('Model expected features:', feat_cols[:20], '...')
+            if isinstance(predictor, Predictor):
+                st.write('Model expected features:', predictor.feature_columns[:20], '...')
+
+if not PREDICTION_SERVICE_URL:
+    with st.sidebar.expander('Prediction cache'):
+        # The model (and scikit-learn with it) is only loaded on the first prediction
+        if st.session_state.get('predictor_loaded') and os.path.exists(model_path_input):
+            try:
+                st.json(_load_predictor(model_path_input).cache.stats())
+            except Exception as e:
+                st.write(f'No cache stats: {e}')
+        else:
+            st.write('Model not loaded yet.')
+
+if instrumentation.is_enabled():
+    # CMM_METRICS=1: where the time of each fetch/prediction went, per stage
+    with st.sidebar.expander('Timings'):
+        timings = [r for r in instrumentation.snapshot() if r['type'] == 'timer']
+        if timings:
+            st.dataframe(pd.DataFrame([{'stage': r['name'], **r['labels'], 'count': r['count'], 'mean_ms': r['mean_ms'],
+                                        'max_ms': r['max_ms']} for r in timings]), hide_index=True)
+        st.download_button('Prometheus metrics', instrumentation.prometheus_text(), file_name='metrics.prom')
 
 st.markdown('---')
 st.markdown('**Note:** For better predictions, use actual watch-time data and retention metrics from YouTube Analytics if available.')
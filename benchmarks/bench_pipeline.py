@@ -0,0 +1,196 @@
+"""Time and memory of every pipeline stage, with regression checks against a baseline.
+
+For each dataset size a synthetic CSV (schema of examples/sample_input.csv)
+is generated once under --data-dir, then load_data, basic_cleaning,
+feature_engineering, preprocess_for_model, every model in get_models, and
+single-row vs batch prediction are profiled with StageProfiler. Results are
+written as JSON; with --baseline the run is compared stage by stage and the
+exit status is 1 when any stage got slower (or allocated more) than
+--tolerance allows.
+
+Usage:
+    python benchmarks/bench_pipeline.py --sizes 10k 1m --out benchmarks/results.json
+    python benchmarks/bench_pipeline.py --sizes 10k --baseline benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --sizes 10k --baseline benchmarks/baseline.json --save-baseline
+    python benchmarks/bench_pipeline.py --compare benchmarks/baseline.json benchmarks/results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import dataset_path
+from src.data_processing import load_data, basic_cleaning, feature_engineering, preprocess_for_model
+from src.modeling import get_models
+from src.profiling import StageProfiler
+from src.serving import Predictor
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+# Stages faster than this are dominated by noise and never flagged
+MIN_SECONDS = 0.05
+MIN_ALLOC_MB = 5.0
+
+def _percentiles_ms(samples):
+    p50, p99 = np.percentile(np.asarray(samples) * 1000, [50, 99])
+    return round(float(p50), 3), round(float(p99), 3)
+
+def run_size(rows, args):
+    path = dataset_path(args.data_dir, rows, args.seed)
+    prof = StageProfiler(trace_allocations=not args.no_trace)
+    with prof.stage('load_data'):
+        df = load_data(path, cache_dir=None)
+    with prof.stage('basic_cleaning'):
+        df = basic_cleaning(df)
+    with prof.stage('feature_engineering'):
+        df = feature_engineering(df)
+    with prof.stage('preprocess_for_model'):
+        X_train, X_test, y_train, y_test, artifacts = preprocess_for_model(df, random_state=args.seed)
+    del df
+
+    # Tree ensembles on 10M rows take hours; cap the rows each model is fitted on
+    n_fit = min(len(X_train), args.max_train_rows)
+    X_fit, y_fit = X_train.iloc[:n_fit], y_train.iloc[:n_fit]
+    models = get_models(random_state=args.seed, n_jobs=args.n_jobs)
+    if args.models:
+        models = {k: v for k, v in models.items() if k in args.models}
+    for name, model in models.items():
+        with prof.stage(f'fit:{name}'):
+            model.fit(X_fit, y_fit)
+
+    extra = {'fit_rows': n_fit}
+    predict_name = args.predict_model if args.predict_model in models else next(iter(models), None)
+    if predict_name is not None:
+        predictor = Predictor(bundle={'model': models[predict_name], 'artifacts': artifacts})
+        raw = pd.read_csv(path, nrows=min(rows, args.batch_rows), parse_dates=['date'])
+        records = raw.head(args.single_rows).to_dict('records')
+        latencies = []
+        with prof.stage('predict_single'):
+            for r in records:
+                start = time.perf_counter()
+                predictor.predict_rows([r])
+                latencies.append(time.perf_counter() - start)
+        with prof.stage('predict_batch'):
+            predictor.predict_frame(raw)
+        p50, p99 = _percentiles_ms(latencies)
+        extra['predict_single'] = {'model': predict_name, 'calls': len(records), 'p50_ms': p50, 'p99_ms': p99}
+        extra['predict_batch'] = {'model': predict_name, 'rows': len(raw)}
+
+    stages = {}
+    for r in prof.report():
+        stages[r.pop('stage')] = r
+    for name, info in extra.items():
+        if name in stages:
+            stages[name].update(info)
+    batch = stages.get('predict_batch')
+    if batch and batch['seconds']:
+        batch['rows_per_s'] = round(batch['rows'] / batch['seconds'])
+    return {'rows': rows, 'fit_rows': n_fit, 'stages': stages}
+
+def environment():
+    import sklearn
+    import xgboost
+    return {
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+        'numpy': np.__version__, 'pandas': pd.__version__, 'sklearn': sklearn.__version__,
+        'xgboost': xgboost.__version__, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def compare(baseline, current, tolerance):
+    """Return rows (size, stage, metric, baseline, current, ratio) that regressed beyond `tolerance`."""
+    regressions = []
+    for size, run in current['results'].items():
+        base_run = baseline.get('results', {}).get(size)
+        if base_run is None:
+            continue
+        for stage, cur in run['stages'].items():
+            base = base_run['stages'].get(stage)
+            if base is None:
+                continue
+            for metric, floor in (('seconds', MIN_SECONDS), ('p50_ms', MIN_SECONDS * 1000),
+                                  ('alloc_peak_mb', MIN_ALLOC_MB)):
+                b, c = base.get(metric), cur.get(metric)
+                if b is None or c is None or max(b, c) < floor:
+                    continue
+                ratio = c / b if b else float('inf')
+                if ratio > 1 + tolerance:
+                    regressions.append((size, stage, metric, b, c, round(ratio, 2)))
+    return regressions
+
+def print_results(results):
+    for size, run in results['results'].items():
+        print(f"\n{size}: {run['rows']:,} rows (models fitted on {run['fit_rows']:,})")
+        print(f"{'stage':<28}{'seconds':>10}{'alloc peak MB':>15}{'peak RSS MB':>13}  notes")
+        for stage, r in run['stages'].items():
+            notes = ''
+            if 'p50_ms' in r:
+                notes = f"p50 {r['p50_ms']} ms, p99 {r['p99_ms']} ms per row"
+            elif 'rows_per_s' in r:
+                notes = f"{r['rows_per_s']:,} rows/s"
+            print(f"{stage:<28}{r['seconds']:>10}{str(r.get('alloc_peak_mb', '-')):>15}{str(r['peak_rss_mb']):>13}  {notes}")
+
+def print_regressions(regressions, tolerance):
+    if not regressions:
+        print(f'\nNo regressions beyond {tolerance:.0%}.')
+        return
+    print(f'\nRegressions beyond {tolerance:.0%}:')
+    for size, stage, metric, b, c, ratio in regressions:
+        print(f'  {size:<5}{stage:<28}{metric:<15}{b:>10} -> {c:<10} x{ratio}')
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Benchmark the data -> features -> train -> predict pipeline')
+    p.add_argument('--sizes', nargs='+', default=['10k'], choices=sorted(SIZES))
+    p.add_argument('--data-dir', type=str, default='benchmarks/.data', help='Where generated CSVs are kept')
+    p.add_argument('--out', type=str, default='benchmarks/results.json')
+    p.add_argument('--baseline', type=str, default=None, help='Compare against this results file')
+    p.add_argument('--save-baseline', action='store_true', help='Write this run to --baseline instead of comparing')
+    p.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='Compare two results files and exit')
+    p.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown/extra allocation (0.25 = 25%%)')
+    p.add_argument('--models', nargs='+', default=None, help='Subset of get_models() to fit')
+    p.add_argument('--max-train-rows', type=int, default=200_000, help='Rows each model is fitted on')
+    p.add_argument('--predict-model', type=str, default='RandomForest')
+    p.add_argument('--single-rows', type=int, default=200, help='Single-row predict_rows calls to time')
+    p.add_argument('--batch-rows', type=int, default=100_000, help='Rows scored in one predict_frame call')
+    p.add_argument('--n-jobs', type=int, default=1)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--no-trace', action='store_true', help='Skip tracemalloc (faster, no alloc_peak_mb)')
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if args.compare:
+        regressions = compare(load_json(args.compare[0]), load_json(args.compare[1]), args.tolerance)
+        print_regressions(regressions, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+    results = {'environment': environment(), 'results': {}}
+    for size in args.sizes:
+        results['results'][size] = run_size(SIZES[size], args)
+    print_results(results)
+
+    out = args.baseline if args.save_baseline and args.baseline else args.out
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('\nWrote', out)
+
+    if args.baseline and not args.save_baseline:
+        baseline = load_json(args.baseline)
+        if baseline.get('environment', {}).get('cpu_count') != os.cpu_count():
+            print('Note: baseline was recorded on a machine with a different CPU count.')
+        regressions = compare(baseline, results, args.tolerance)
+        print_regressions(regressions, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
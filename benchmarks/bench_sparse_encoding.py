@@ -0,0 +1,56 @@
+"""Peak memory and fit time of the dense vs sparse preprocessing paths.
+
+Builds a synthetic frame with high-cardinality category/country columns,
+runs preprocess_for_model with sparse=False and sparse=True (optionally with
+max_categories capping) and fits Ridge on each matrix.
+
+Usage:
+    python benchmarks/bench_sparse_encoding.py --rows 200000 --categories 2000 --countries 200
+"""
+import argparse
+import os
+import sys
+import time
+
+from scipy import sparse as sp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_frame
+from src.data_processing import basic_cleaning, feature_engineering, preprocess_for_model
+from src.profiling import StageProfiler
+from sklearn.linear_model import Ridge
+
+def matrix_mb(X):
+    if sp.issparse(X):
+        return (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 1e6
+    return X.memory_usage(index=False).sum() / 1e6
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--rows', type=int, default=200_000)
+    p.add_argument('--categories', type=int, default=2000)
+    p.add_argument('--countries', type=int, default=200)
+    p.add_argument('--max-categories', type=int, default=100)
+    args = p.parse_args()
+
+    df = feature_engineering(basic_cleaning(make_frame(args.rows, n_categories=args.categories, n_countries=args.countries)), copy=False)
+    variants = {
+        'dense': dict(sparse=False),
+        'sparse': dict(sparse=True),
+        f'sparse+max_categories={args.max_categories}': dict(sparse=True, max_categories=args.max_categories),
+    }
+    profiler = StageProfiler()
+    print(f"{'variant':<34}{'columns':>9}{'matrix MB':>11}{'alloc peak MB':>15}{'Ridge fit s':>13}")
+    for name, kwargs in variants.items():
+        with profiler.stage(name):
+            X_train, X_test, y_train, y_test, artifacts = preprocess_for_model(df, **kwargs)
+        start = time.perf_counter()
+        Ridge().fit(X_train, y_train)
+        fit_s = time.perf_counter() - start
+        print(f"{name:<34}{len(artifacts['feature_columns']):>9}{matrix_mb(X_train):>11.1f}"
+              f"{profiler.stages[-1]['alloc_peak_mb']:>15}{fit_s:>13.2f}")
+        del X_train, X_test
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Cold-start time of a scoring process: imports, bundle load, first prediction.
+
+Trains a RandomForest and an XGBoost bundle on synthetic data, saves each as a
+plain joblib pickle (the old format) and with save_model (versioned format,
+loaded with mmap_mode='r'), then times fresh interpreters that import
+src.serving, load the bundle and score one row.
+
+Usage:
+    python benchmarks/bench_startup.py --rows 50000 --trees 300 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Runs in a fresh interpreter so nothing is already imported or cached
+CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+import pandas as pd
+from src.serving import Predictor, rows_to_frame
+from src.modeling import load_model
+t1 = time.perf_counter()
+bundle = load_model({path!r}, mmap_mode={mmap!r})
+t2 = time.perf_counter()
+predictor = Predictor(bundle=bundle)
+predictor.predict_rows([{{'views': 1000, 'likes': 50, 'comments': 5, 'watch_time_minutes': 3000,
+                         'video_length_minutes': 10, 'subscribers': 10000, 'category': '1',
+                         'device': 'Mobile', 'country': '1', 'date': '2024-06-01'}}])
+t3 = time.perf_counter()
+print(json.dumps({{'import_s': t1 - t0, 'load_s': t2 - t1, 'first_predict_s': t3 - t2, 'total_s': t3 - t0}}))
+'''
+
+def time_child(path, mmap_mode, repeat):
+    code = CHILD.format(root=ROOT, path=path, mmap=mmap_mode)
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {k: round(statistics.median(r[k] for r in runs), 3) for k in runs[0]}
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--rows', type=int, default=50_000)
+    p.add_argument('--trees', type=int, default=300)
+    p.add_argument('--repeat', type=int, default=5)
+    args = p.parse_args()
+
+    import joblib
+    from sklearn.ensemble import RandomForestRegressor
+    from xgboost import XGBRegressor
+    from synthetic import make_frame
+    from src.data_processing import basic_cleaning, feature_engineering, preprocess_for_model
+    from src.modeling import save_model
+
+    df = feature_engineering(basic_cleaning(make_frame(args.rows, n_categories=20, n_countries=10)), copy=False)
+    X_train, _, y_train, _, artifacts = preprocess_for_model(df)
+    models = {
+        'RandomForest': RandomForestRegressor(n_estimators=args.trees, min_samples_leaf=5, n_jobs=-1, random_state=0),
+        'XGBoost': XGBRegressor(n_estimators=args.trees, max_depth=8, verbosity=0),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'model':<14}{'format':<16}{'MB':>8}{'import s':>10}{'load s':>9}{'1st pred s':>12}{'total s':>10}")
+        for name, model in models.items():
+            bundle = {'model': model.fit(X_train, y_train), 'artifacts': artifacts}
+            legacy, versioned = os.path.join(tmp, f'{name}_legacy.joblib'), os.path.join(tmp, f'{name}.joblib')
+            joblib.dump(bundle, legacy)
+            save_model(bundle, versioned)
+            for label, path, mmap_mode in (('joblib', legacy, None), ('versioned+mmap', versioned, 'r')):
+                size = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp)
+                           if f.startswith(os.path.basename(path)))
+                r = time_child(path, mmap_mode, args.repeat)
+                print(f"{name:<14}{label:<16}{size / 1e6:>8.1f}{r['import_s']:>10}{r['load_s']:>9}"
+                      f"{r['first_predict_s']:>12}{r['total_s']:>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Compiled tree engine vs native predict: parity and latency by batch size.
+
+Trains a RandomForest and an early-stopped XGBoost model on synthetic data,
+compiles each with src/tree_engine.py, checks that the compiled predictions
+match the native ones on the held-out rows (dense and, with --sparse, CSR),
+then times both backends from single rows up to large batches. Exits with
+status 1 if any parity check fails.
+
+Usage:
+    python benchmarks/bench_tree_engine.py --rows 50000 --trees 200 --batches 1 100 10000 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_frame
+from src.data_processing import basic_cleaning, feature_engineering, preprocess_for_model
+from src.tree_engine import compile_model, parity
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def take(X, n):
+    n = min(n, X.shape[0])
+    return X[:n] if hasattr(X, 'tocsr') else X.iloc[:n]
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--rows', type=int, default=50_000)
+    p.add_argument('--trees', type=int, default=200)
+    p.add_argument('--batches', type=int, nargs='+', default=[1, 100, 10_000, 100_000])
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--sparse', action='store_true', help='Also check parity on CSR input')
+    p.add_argument('--n-jobs', type=int, default=-1, help='Native RandomForest predict threads')
+    args = p.parse_args()
+
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import train_test_split
+    from xgboost import XGBRegressor
+
+    df = feature_engineering(basic_cleaning(make_frame(args.rows)), copy=False)
+    X_train, X_test, y_train, y_test, _ = preprocess_for_model(df)
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=0.1, random_state=0)
+    models = {
+        'RandomForest': RandomForestRegressor(n_estimators=args.trees, min_samples_leaf=2, n_jobs=args.n_jobs,
+                                              random_state=0).fit(X_train, y_train),
+        'XGBoost': XGBRegressor(n_estimators=args.trees * 5, early_stopping_rounds=20, max_depth=8,
+                                verbosity=0).fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False),
+    }
+    sparse_sets = {}
+    if args.sparse:
+        Xs_train, Xs_test, _, _, _ = preprocess_for_model(df, sparse=True)
+        sparse_sets = {'RandomForest': (RandomForestRegressor(n_estimators=args.trees, min_samples_leaf=2,
+                                                              n_jobs=args.n_jobs, random_state=0)
+                                        .fit(Xs_train, y_train), Xs_test),
+                       'XGBoost': (XGBRegressor(n_estimators=args.trees, max_depth=8, verbosity=0)
+                                   .fit(Xs_train, y_train), Xs_test)}
+
+    # Large batches are built by tiling the held-out rows
+    X_big = X_test.iloc[np.resize(np.arange(len(X_test)), max(args.batches))]
+    failed = False
+    for name, model in models.items():
+        start = time.perf_counter()
+        engine = compile_model(model)
+        compile_s = time.perf_counter() - start
+        diff, ok = parity(engine, model, X_test)
+        failed |= not ok
+        print(f"\n{name}: {engine.n_trees} trees, {engine.n_nodes:,} nodes, compiled in {compile_s:.2f}s, "
+              f"{engine.nbytes / 1e6:.1f} MB")
+        print(f"  parity (dense): max abs diff {diff:.3g} -> {'OK' if ok else 'FAIL'}")
+        if name in sparse_sets:
+            sparse_model, Xs = sparse_sets[name]
+            diff, ok = parity(compile_model(sparse_model), sparse_model, Xs)
+            failed |= not ok
+            print(f"  parity (CSR):   max abs diff {diff:.3g} -> {'OK' if ok else 'FAIL'}")
+        print(f"  {'batch':>8}{'native ms':>12}{'compiled ms':>13}{'speedup':>9}")
+        for n in args.batches:
+            X = take(X_big, n)
+            native = best_time(lambda: model.predict(X), args.repeat)
+            compiled = best_time(lambda: engine.predict(X), args.repeat)
+            print(f"  {n:>8}{native * 1000:>12.2f}{compiled * 1000:>13.2f}{native / compiled:>8.1f}x")
+    if failed:
+        print('\nParity check FAILED')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
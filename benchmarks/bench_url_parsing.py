@@ -0,0 +1,119 @@
+"""Per-item vs vectorized video-id extraction and ISO-8601 duration parsing.
+
+Builds a bulk paste of mixed URL shapes (watch?v=, youtu.be, embed, /v/,
+bare ids, junk) and YouTube-style durations, then times:
+
+- the previous per-item code: four re.search calls with double-escaped
+  dots plus a fullmatch, and isodate per duration;
+- the current per-item extract_video_id / parse_iso_duration_to_minutes;
+- the bulk extract_video_ids / parse_iso_durations_to_minutes on a Series.
+
+It also checks that the bulk results equal the per-item ones and counts the
+short/embed links the previous patterns missed.
+
+Usage:
+    python benchmarks/bench_url_parsing.py --n 50000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.youtube_fetch import (
+    extract_video_id, extract_video_ids, parse_iso_duration_to_minutes, parse_iso_durations_to_minutes,
+)
+
+ID_CHARS = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-'))
+URL_SHAPES = ['https://www.youtube.com/watch?v={}', 'https://youtu.be/{}?si=share', 'https://www.youtube.com/embed/{}',
+              'https://www.youtube.com/v/{}', '{}', 'https://m.youtube.com/watch?feature=share&v={}&t=42',
+              'https://example.com/not-a-video/{}']
+
+def legacy_extract_video_id(url_or_id):
+    s = (url_or_id or "").strip()
+    if not s:
+        return None
+    patterns = [
+        r"v=([A-Za-z0-9_-]{11})",
+        r"youtu\\.be/([A-Za-z0-9_-]{11})",
+        r"youtube\\.com/embed/([A-Za-z0-9_-]{11})",
+        r"youtube\\.com/v/([A-Za-z0-9_-]{11})"
+    ]
+    for p in patterns:
+        m = re.search(p, s)
+        if m:
+            return m.group(1)
+    if re.fullmatch(r"[A-Za-z0-9_-]{11}", s):
+        return s
+    return None
+
+def legacy_parse_iso_duration_to_minutes(iso_duration):
+    import isodate
+    try:
+        dur = isodate.parse_duration(iso_duration)
+        if isinstance(dur, timedelta):
+            return dur.total_seconds() / 60.0
+    except Exception:
+        pass
+    return None
+
+def make_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = [''.join(row) for row in ID_CHARS[rng.integers(0, len(ID_CHARS), (n, 11))]]
+    shapes = rng.integers(0, len(URL_SHAPES), n)
+    urls = [URL_SHAPES[k].format(i) for k, i in zip(shapes, ids)]
+    h, m, s = rng.integers(0, 3, n), rng.integers(0, 60, n), rng.integers(0, 60, n)
+    durations = [f"PT{f'{a}H' if a else ''}{f'{b}M' if b else ''}{c}S" for a, b, c in zip(h, m, s)]
+    durations[::97] = ['P0D'] * len(durations[::97])
+    return urls, durations
+
+def timed(fn, repeat):
+    best, out = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--n', type=int, default=50_000, help='URLs and durations to parse')
+    p.add_argument('--repeat', type=int, default=3)
+    args = p.parse_args()
+    urls, durations = make_inputs(args.n)
+    url_series, duration_series = pd.Series(urls), pd.Series(durations)
+
+    legacy_t, legacy_ids = timed(lambda: [legacy_extract_video_id(u) for u in urls], args.repeat)
+    item_t, item_ids = timed(lambda: [extract_video_id(u) for u in urls], args.repeat)
+    bulk_t, bulk_ids = timed(lambda: extract_video_ids(url_series), args.repeat)
+    missed = sum(a is None and b is not None for a, b in zip(legacy_ids, item_ids))
+    ids_ok = bulk_ids.tolist() == item_ids
+
+    legacy_dt, legacy_min = timed(lambda: [legacy_parse_iso_duration_to_minutes(d) for d in durations], args.repeat)
+    item_dt, item_min = timed(lambda: [parse_iso_duration_to_minutes(d) for d in durations], args.repeat)
+    bulk_dt, bulk_min = timed(lambda: parse_iso_durations_to_minutes(duration_series), args.repeat)
+    minutes_ok = np.allclose(bulk_min.to_numpy(), np.array(legacy_min, dtype=float), equal_nan=True) and \
+        np.allclose(np.array(item_min, dtype=float), np.array(legacy_min, dtype=float), equal_nan=True)
+
+    print(f'{args.n:,} inputs, best of {args.repeat}')
+    print(f"{'':<34}{'ms':>10}{'speedup':>10}")
+    for label, t, base in (('extract_video_id (previous)', legacy_t, legacy_t),
+                           ('extract_video_id (per item)', item_t, legacy_t),
+                           ('extract_video_ids (Series)', bulk_t, legacy_t),
+                           ('duration via isodate (previous)', legacy_dt, legacy_dt),
+                           ('parse_iso_duration_to_minutes', item_dt, legacy_dt),
+                           ('parse_iso_durations_to_minutes', bulk_dt, legacy_dt)):
+        print(f'{label:<34}{t * 1000:>10.1f}{base / t:>9.1f}x')
+    print(f'Links the previous patterns missed: {missed:,}')
+    print('Bulk ids match per-item:', ids_ok, '| durations match isodate:', minutes_ok)
+    if not (ids_ok and minutes_ok):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
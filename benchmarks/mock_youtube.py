@@ -0,0 +1,66 @@
+"""Local stand-in for the YouTube Data API v3 endpoints used by src/youtube_fetch.py.
+
+Serves /videos, /channels and /videoCategories with synthetic items, an
+optional per-request latency and an optional fraction of 429 responses.
+Point the fetchers at it with YT_API_BASE=http://127.0.0.1:<port>.
+"""
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+class MockYouTubeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with server.lock:
+            server.calls += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(429, {'error': {'code': 429, 'message': 'rateLimitExceeded'}})
+            return
+        ids = query.get('id', [''])[0].split(',')
+        if url.path.endswith('/videos'):
+            items = [{
+                'id': vid,
+                'snippet': {'title': f'Video {vid}', 'publishedAt': '2024-01-01T00:00:00Z',
+                            'categoryId': str(10 + hash(vid) % 20), 'channelId': f'UC{hash(vid) % server.n_channels:022d}'},
+                'statistics': {'viewCount': '1000', 'likeCount': '50', 'commentCount': '7'},
+                'contentDetails': {'duration': 'PT12M30S'},
+            } for vid in ids if vid]
+        elif url.path.endswith('/channels'):
+            items = [{'id': cid, 'statistics': {'subscriberCount': '12345'}} for cid in ids if cid]
+        elif url.path.endswith('/videoCategories'):
+            items = [{'id': str(i), 'snippet': {'title': f'Category {i}'}} for i in range(1, 45)]
+        else:
+            self._send(404, {'error': {'code': 404}})
+            return
+        self._send(200, {'items': items})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_mock_server(port=0, latency=0.0, error_rate=0.0, n_channels=500):
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockYouTubeHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.n_channels = n_channels
+    server.calls = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,95 @@
+"""Synthetic datasets with the schema of examples/sample_input.csv.
+
+Rows are generated in fixed-size blocks with a per-block seed, so a 10M-row
+file is written without holding it in memory and the first N rows of any
+size are identical.
+
+Usage:
+    python benchmarks/synthetic.py --rows 1000000 --out benchmarks/.data/1m.csv
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['video_id', 'date', 'views', 'likes', 'comments', 'watch_time_minutes', 'video_length_minutes',
+           'subscribers', 'category', 'device', 'country', 'ad_revenue_usd']
+CATEGORIES = ['Gaming', 'Music', 'Education', 'Entertainment', 'Sports', 'Tech']
+DEVICES = ['Mobile', 'Desktop', 'Tablet', 'TV']
+COUNTRIES = ['US', 'IN', 'BR', 'GB', 'JP', 'CA', 'DE', 'MX']
+# Ad revenue per 1000 watch minutes, by country
+COUNTRY_RPM = np.array([4.0, 0.6, 1.0, 3.5, 2.5, 3.8, 3.2, 1.2])
+BLOCK_ROWS = 100_000
+
+def _zipf_codes(rng, n, rows):
+    # Zipf-like popularity, so category capping has a long tail to fold away
+    p = 1.0 / np.arange(1, n + 1)
+    return rng.choice(n, rows, p=p / p.sum())
+
+def make_block(start, rows, seed=0, missing_rate=0.02, n_categories=None, n_countries=None):
+    """`n_categories` / `n_countries` replace the real labels with that many Zipf-distributed ones."""
+    rng = np.random.default_rng([seed, start // BLOCK_ROWS])
+    views = np.floor(rng.lognormal(8, 2, rows)).clip(0, 5e8)
+    length = rng.uniform(1, 60, rows).round(2)
+    watch = (views * length * rng.beta(2, 5, rows)).round(2)
+    if n_countries:
+        codes = _zipf_codes(rng, n_countries, rows)
+        countries = np.char.add('country_', codes.astype(str))
+        country = codes % len(COUNTRIES)
+    else:
+        country = rng.integers(0, len(COUNTRIES), rows)
+        countries = np.array(COUNTRIES)[country]
+    df = pd.DataFrame({
+        'video_id': [f'vid_{i:09d}' for i in range(start, start + rows)],
+        'date': (pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')).strftime('%Y-%m-%d'),
+        'views': views,
+        'likes': np.floor(views * rng.uniform(0, 0.08, rows)),
+        'comments': np.floor(views * rng.uniform(0, 0.01, rows)),
+        'watch_time_minutes': watch,
+        'video_length_minutes': length,
+        'subscribers': np.floor(rng.lognormal(10, 2, rows)),
+        'category': (np.char.add('category_', _zipf_codes(rng, n_categories, rows).astype(str)) if n_categories
+                     else np.array(CATEGORIES)[rng.integers(0, len(CATEGORIES), rows)]),
+        'device': np.array(DEVICES)[rng.integers(0, len(DEVICES), rows)],
+        'country': countries,
+        'ad_revenue_usd': (watch / 1000 * COUNTRY_RPM[country] * rng.lognormal(0, 0.3, rows)).round(4),
+    })
+    for c in ('likes', 'comments', 'watch_time_minutes', 'category'):
+        df.loc[rng.random(rows) < missing_rate, c] = np.nan
+    return df[COLUMNS]
+
+def make_frame(rows, seed=0, n_categories=None, n_countries=None):
+    """In-memory frame with parsed dates, like load_data() returns."""
+    df = pd.concat([make_block(s, min(BLOCK_ROWS, rows - s), seed, n_categories=n_categories, n_countries=n_countries)
+                    for s in range(0, rows, BLOCK_ROWS)], ignore_index=True)
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+def write_csv(path, rows, seed=0):
+    """Write `rows` synthetic rows to `path` block by block; returns the path."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    for start in range(0, rows, BLOCK_ROWS):
+        block = make_block(start, min(BLOCK_ROWS, rows - start), seed)
+        block.to_csv(tmp, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    os.replace(tmp, path)
+    return path
+
+def dataset_path(data_dir, rows, seed=0):
+    """Generate the dataset once per (rows, seed) and reuse it afterwards."""
+    path = os.path.join(data_dir, f'synthetic_{rows}_{seed}.csv')
+    if not os.path.exists(path):
+        write_csv(path, rows, seed)
+    return path
+
+def main():
+    p = argparse.ArgumentParser(description='Generate a synthetic monetization dataset')
+    p.add_argument('--rows', type=int, default=10_000)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--out', type=str, required=True)
+    args = p.parse_args()
+    print('Wrote', write_csv(args.out, args.rows, args.seed))
+
+if __name__ == '__main__':
+    main()
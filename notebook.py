@@ -8,62 +8,203 @@ This script covers:
 - Evaluation & saving best model
 Usage:
     python notebook.py --data path/to/dataset.csv
+    python notebook.py --store data/store --data path/to/daily_increment.csv
 """
 import argparse, os
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from src.data_processing import load_data, basic_cleaning, feature_engineering, preprocess_for_model
-from src.modeling import train_and_evaluate, save_model
+from src.data_processing import (load_data, basic_cleaning, feature_engineering, preprocess_for_model, model_inputs,
+                                 transform_features, file_fingerprint)
+from src.modeling import train_and_evaluate, save_model, evaluate_model
+from src.cross_validation import select_model_cv
+from src.profiling import StageProfiler
+from src.incremental import train_incremental
+from src.tree_engine import attach_engine
+from src.dataset_store import DatasetStore
+from src.eda import EDA_CACHE_DIR, cached_profile, frame_chunks, profile_chunks
+from src.ensemble import build_ensemble, interval_coverage
+from src.explain import BACKGROUND_KEY, summarize_background
 import joblib
 
+DEFAULT_DATA = 'data/youtube_monetization.csv'
+
 def parse_args():
     p = argparse.ArgumentParser()
-    p.add_argument('--data', type=str, default='data/youtube_monetization.csv', help='Path to CSV dataset')
+    p.add_argument('--data', type=str, default=None, help=f'Path to CSV dataset (default: {DEFAULT_DATA})')
+    p.add_argument('--store', type=str, default=None,
+                   help='Incremental dataset store: --data (if given) is upserted into it, then training reads its cached features')
     p.add_argument('--model-out', type=str, default='models/best_model.joblib', help='Path to save best model')
-    return p.parse_args()
+    p.add_argument('--n-jobs', type=int, default=1, help='Total CPU cores for training (-1 = all)')
+    p.add_argument('--search', choices=['random', 'halving'], default=None, help='Hyperparameter search per model')
+    p.add_argument('--n-iter', type=int, default=10, help='Candidates per model for --search random')
+    p.add_argument('--time-budget', type=float, default=None, help='Wall-clock training budget in seconds')
+    p.add_argument('--profile', action='store_true', help='Report time, peak RSS and allocations per stage')
+    p.add_argument('--incremental', choices=['sgd', 'xgboost'], default=None,
+                   help='Stream the CSV in chunks and train out of core (skips EDA and the model comparison)')
+    p.add_argument('--chunksize', type=int, default=100_000, help='Rows per chunk for --incremental and the EDA pass')
+    p.add_argument('--eda-sample', type=int, default=50_000, help='Rows reservoir-sampled for EDA plots (0 = none)')
+    p.add_argument('--no-eda-cache', action='store_true', help=f'Recompute EDA statistics instead of reusing {EDA_CACHE_DIR}')
+    p.add_argument('--epochs', type=int, default=5, help='Passes over the data for --incremental sgd')
+    p.add_argument('--sparse', action='store_true', help='Keep one-hot features sparse (CSR) end to end')
+    p.add_argument('--max-categories', type=int, default=None, help='Cap one-hot columns per categorical (rest -> other)')
+    p.add_argument('--min-frequency', type=float, default=None, help='Fold categories rarer than this count/fraction into other')
+    p.add_argument('--cv', type=int, default=None, metavar='K',
+                   help='Select the model by K-fold cross-validation (mean/std per model), then refit it on all rows')
+    p.add_argument('--compile-trees', action='store_true',
+                   help='Store array-backed node tables for a RandomForest/XGBoost winner (parity-checked on the test split)')
+    p.add_argument('--ensemble', type=int, default=None, metavar='K',
+                   help='Save an inverse-MSE weighted ensemble of the K best models instead of the single best')
+    p.add_argument('--quantiles', type=str, default='0.1,0.9',
+                   help="Quantiles of the ensemble's revenue band ('' = no band model)")
+    p.add_argument('--member-budget-ms', type=float, default=None,
+                   help='Per-call latency budget for ensemble members other than the best one')
+    p.add_argument('--shap-background', type=int, default=50, metavar='K',
+                   help='k-means centroids summarizing the training rows for SHAP explanations (0 = none)')
+    args = p.parse_args()
+    if args.ensemble is not None and args.cv is not None:
+        p.error('--ensemble cannot be combined with --cv')
+    if args.cv is not None and args.search:
+        p.error('--cv cannot be combined with --search')
+    if args.store and args.incremental:
+        p.error('--store cannot be combined with --incremental')
+    if args.data is None and not args.store:
+        args.data = DEFAULT_DATA
+    return args
+
+def train_on_split(df, args, profiler):
+    # Preprocess & split
+    with profiler.stage('preprocess_for_model'):
+        X_train, X_test, y_train, y_test, artifacts = preprocess_for_model(df, sparse=args.sparse,
+                                                                           max_categories=args.max_categories,
+                                                                           min_frequency=args.min_frequency)
+    print('Train size:', X_train.shape, 'Test size:', X_test.shape)
+
+    # Train and evaluate
+    with profiler.stage('train_and_evaluate'):
+        results, best_name, best_model = train_and_evaluate(X_train, y_train, X_test, y_test, n_jobs=args.n_jobs,
+                                                            search=args.search, n_iter=args.n_iter,
+                                                            time_budget=args.time_budget)
+    print('\nModel results:')
+    for name, info in results.items():
+        print(name, info['metrics'])
+
+    print('\nBest model:', best_name)
+    if args.ensemble:
+        quantiles = tuple(float(q) for q in args.quantiles.split(',') if q.strip())
+        with profiler.stage('build_ensemble'):
+            ensemble = build_ensemble(results, X_train, y_train, top_k=args.ensemble, quantiles=quantiles,
+                                      member_budget_ms=args.member_budget_ms, n_jobs=args.n_jobs)
+        total = sum(w for _, _, w in ensemble.members)
+        print('\nEnsemble member shares:', {name: round(w / total, 3) for name, _, w in ensemble.members})
+        print('Ensemble', evaluate_model(ensemble, X_test, y_test))
+        if quantiles:
+            coverage = interval_coverage(ensemble.predict_intervals(X_test), y_test, quantiles)
+            print(f'Test rows inside the {min(quantiles):g}-{max(quantiles):g} band: {coverage:.1%}')
+        best_name, best_model = 'Ensemble', ensemble
+    return best_name, best_model, artifacts, X_test
 
 def main():
     args = parse_args()
     os.makedirs('models', exist_ok=True)
 
-    print('Loading data...', args.data)
-    df = load_data(args.data)
-    print('Initial shape:', df.shape)
+    if args.incremental:
+        print('Training out of core on', args.data, 'with', args.incremental)
+        bundle, metrics = train_incremental(args.data, learner=args.incremental, chunksize=args.chunksize,
+                                            epochs=args.epochs, sparse=args.sparse)
+        print('Holdout metrics:', metrics)
+        save_model(bundle, args.model_out)
+        print('Saved model bundle to', args.model_out)
+        return
+
+    profiler = StageProfiler(trace_allocations=args.profile)
 
-    df = basic_cleaning(df)
-    df = feature_engineering(df)
-    print('After feature engineering shape:', df.shape)
+    store = DatasetStore(args.store) if args.store else None
+    if store is not None:
+        if args.data:
+            with profiler.stage('store_upsert'):
+                touched = store.ingest(args.data)
+            print(f'Upserted {args.data} into {args.store} ({len(touched)} partitions rewritten)')
+        # Only new or changed partitions are feature-engineered; the rest come from the cache
+        with profiler.stage('store_load'):
+            df = store.load()
+        print('Loaded', df.shape, 'from', args.store, '- reference date', store.reference_date)
+    else:
+        print('Loading data...', args.data)
+        with profiler.stage('load_data'):
+            df = load_data(args.data)
+        print('Initial shape:', df.shape)
 
-    # Quick EDA prints
+        # The loaded frame is owned here, so clean and derive features in place
+        with profiler.stage('basic_cleaning'):
+            df = basic_cleaning(df, copy=False)
+        with profiler.stage('feature_engineering'):
+            df = feature_engineering(df, copy=False)
+        print('After feature engineering shape:', df.shape)
+
+    # Quick EDA: one streaming pass with mergeable accumulators, cached per dataset
     print('\n--- EDA ---')
-    print(df.describe().T.head(15))
+    fingerprint = store.fingerprint() if store is not None else file_fingerprint(args.data)
+    with profiler.stage('eda'):
+        stats = cached_profile(fingerprint, lambda: profile_chunks(frame_chunks(df, args.chunksize), args.eda_sample),
+                               cache_dir=None if args.no_eda_cache else EDA_CACHE_DIR, sample_size=args.eda_sample)
+    print(stats.summary().head(15))
     print('\nMissing values percent:')
-    print((df.isna().mean()*100).sort_values(ascending=False).head(10))
+    print(stats.missing().sort_values(ascending=False).head(10))
 
-    # Simple correlation plot for numeric columns
-    num_cols = df.select_dtypes(include=['number']).columns.tolist()
-    if 'ad_revenue_usd' in num_cols:
+    # Correlation plot for numeric columns; cell labels only while they stay readable
+    corr = stats.correlation()
+    if 'ad_revenue_usd' in corr.columns:
         plt.figure(figsize=(10,8))
-        sns.heatmap(df[num_cols].corr(), annot=True, fmt='.2f', cmap='vlag')
+        sns.heatmap(corr, annot=len(corr) <= 20, fmt='.2f', cmap='vlag')
         plt.title('Numeric correlation matrix')
         plt.tight_layout()
         plt.savefig('assets/correlation_matrix.png')
         print('Saved correlation matrix to assets/correlation_matrix.png')
+    if stats.sample is not None and 'ad_revenue_usd' in stats.sample.columns:
+        plt.figure(figsize=(8,5))
+        sns.histplot(np.log1p(stats.sample['ad_revenue_usd'].dropna()), bins=60)
+        plt.xlabel('log1p(ad_revenue_usd)')
+        plt.title(f'Target distribution ({len(stats.sample):,}-row sample)')
+        plt.tight_layout()
+        plt.savefig('assets/target_distribution.png')
+        print('Saved target distribution to assets/target_distribution.png')
 
-    # Preprocess & split
-    X_train, X_test, y_train, y_test, artifacts = preprocess_for_model(df)
-    print('Train size:', X_train.shape, 'Test size:', X_test.shape)
+    if args.cv:
+        with profiler.stage('select_model_cv'):
+            results, best_name, best_model, artifacts = select_model_cv(df, n_splits=args.cv, n_jobs=args.n_jobs,
+                                                                        time_budget=args.time_budget, sparse=args.sparse,
+                                                                        max_categories=args.max_categories,
+                                                                        min_frequency=args.min_frequency)
+        print(f'\n{args.cv}-fold cross-validation (mean +/- std):')
+        for name, info in results.items():
+            m = info['metrics']
+            print(f"{name}: rmse {m['rmse']:.4f} +/- {m['rmse_std']:.4f}, r2 {m['r2']:.4f} +/- {m['r2_std']:.4f}, "
+                  f"mae {m['mae']:.4f} +/- {m['mae_std']:.4f}")
+        print('\nBest model (refit on all rows):', best_name)
+        X_check = transform_features(model_inputs(df)[0].head(5000), artifacts)
+    else:
+        best_name, best_model, artifacts, X_check = train_on_split(df, args, profiler)
 
-    # Train and evaluate
-    results, best_name, best_model = train_and_evaluate(X_train, y_train, X_test, y_test)
-    print('\nModel results:')
-    for name, info in results.items():
-        print(name, info['metrics'])
-
-    print('\nBest model:', best_name)
-    save_model({'model': best_model, 'artifacts': artifacts}, args.model_out)
+    if store is not None:
+        # Scoring must measure video_age_days from the date the store's features used
+        artifacts['reference_date'] = store.reference_date
+    if args.shap_background:
+        # Computed once here so explanations never need the training data
+        with profiler.stage('shap_background'):
+            rows = model_inputs(df)[0].sample(min(len(df), 10_000), random_state=0)
+            artifacts[BACKGROUND_KEY] = summarize_background(transform_features(rows, artifacts), k=args.shap_background)
+    bundle = {'model': best_model, 'artifacts': artifacts}
+    if args.compile_trees:
+        attach_engine(bundle, X_check)
+        print('Compiled tree engine:', 'attached' if bundle['engine'] is not None else 'not applicable')
+    save_model(bundle, args.model_out)
     print('Saved best model bundle to', args.model_out)
 
+    if args.profile:
+        print('\n--- Stage profile ---')
+        print(profiler.format())
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,37 @@
+"""Batch scoring for large CSVs with the saved model bundle.
+
+Reads the input in chunks, runs feature engineering and the fitted
+preprocessing pipeline on each chunk and streams predictions to CSV or
+Parquet, so memory use does not grow with the input size.
+Usage:
+    python score.py --data path/to/videos.csv --out predictions.parquet --n-jobs 4
+"""
+import argparse
+from src.modeling import predict_batch
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--data', type=str, required=True, help='CSV with the same columns as examples/sample_input.csv')
+    p.add_argument('--model', type=str, default='models/best_model.joblib', help='Path to the saved model bundle')
+    p.add_argument('--out', type=str, default='predictions.csv', help='Output path (.csv or .parquet)')
+    p.add_argument('--chunksize', type=int, default=100_000, help='Rows per chunk')
+    p.add_argument('--n-jobs', type=int, default=1, help='Worker processes (0 = all cores)')
+    p.add_argument('--reference-date', type=str, default=None, help='Date video_age_days is measured from (default: training reference date)')
+    p.add_argument('--backend', choices=['auto', 'native', 'compiled'], default='auto',
+                   help='Tree-ensemble inference: compiled node tables (auto = small batches, when the bundle has them) or the native model')
+    p.add_argument('--intervals', action='store_true',
+                   help='Also write the quantile band columns of an ensemble bundle (e.g. _p10/_p90)')
+    p.add_argument('--explain', action='store_true',
+                   help='Also write SHAP contributions per input feature (shap_<feature> columns)')
+    p.add_argument('--explain-n-jobs', type=int, default=1, help='Threads explaining each chunk (per worker process)')
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    out = predict_batch(args.data, model_path=args.model, out_path=args.out, chunksize=args.chunksize,
+                        n_jobs=args.n_jobs, reference_date=args.reference_date, backend=args.backend,
+                        intervals=args.intervals, explain=args.explain, explain_n_jobs=args.explain_n_jobs)
+    print('Saved predictions to', out)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Low-latency HTTP/JSON prediction server for the saved model bundle.
+
+Loads the bundle once, keeps it resident and micro-batches concurrent
+requests before calling model.predict. See src/serving.py for the API.
+Usage:
+    python serve.py --model models/best_model.joblib --port 8080
+    curl -X POST localhost:8080/predict -d '{"rows": [{"views": 1000, "likes": 50, ...}]}'
+"""
+import argparse
+from src.serving import Predictor, make_server
+from src.prediction_cache import PredictionCache
+from src import instrumentation
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--model', type=str, default='models/best_model.joblib', help='Path to the saved model bundle')
+    p.add_argument('--host', type=str, default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8080)
+    p.add_argument('--max-batch-size', type=int, default=256, help='Max rows per coalesced model call')
+    p.add_argument('--max-wait-ms', type=float, default=5.0, help='How long to wait for more requests to batch')
+    p.add_argument('--cache-size', type=int, default=100_000, help='Memoized predictions (0 disables the cache)')
+    p.add_argument('--cache-ttl', type=float, default=None, help='Seconds before a memoized prediction expires')
+    p.add_argument('--backend', choices=['auto', 'native', 'compiled'], default='auto',
+                   help='Tree-ensemble inference: compiled node tables (auto = small batches, when the bundle has them) or the native model')
+    p.add_argument('--instrument', action='store_true',
+                   help='Record stage timers/counters for GET /metrics/prometheus (same as CMM_METRICS=1)')
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if args.instrument:
+        instrumentation.enable()
+    cache = PredictionCache(args.cache_size, args.cache_ttl) if args.cache_size > 0 else None
+    predictor = Predictor(model_path=args.model, cache=cache, backend=args.backend)
+    server = make_server(predictor, args.host, args.port, args.max_batch_size, args.max_wait_ms)
+    print(f'Serving {args.model} on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
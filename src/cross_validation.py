@@ -0,0 +1,155 @@
+# src/cross_validation.py
+"""K-fold model selection over preprocessed folds that every candidate shares.
+
+prepare_folds() fits the imputer/encoder/scaler on each fold's training rows
+only, transforms that fold once and writes the matrices as .npy files (CSR
+matrices as their data/indices/indptr arrays). Every (model, fold) job then
+memory-maps its fold read-only instead of re-running the preprocessing or
+receiving a pickled copy, so K folds x M models cost K preprocessing fits and
+one copy of each fold in the page cache.
+
+    results, best_name, best_model, artifacts = select_model_cv(df, n_splits=5, n_jobs=-1)
+
+Each result carries the per-fold metrics and their mean and std. The winner
+(lowest mean RMSE) is refit on all rows with a preprocessor fitted on all
+rows; XGBoost is refit with the mean early-stopped round count of its folds.
+"""
+import os
+import shutil
+import tempfile
+import time
+import warnings
+
+import numpy as np
+from joblib import Parallel, delayed, parallel_backend
+
+from src.data_processing import TARGET, model_inputs, fit_preprocessing, transform_features
+from src.instrumentation import timed
+from src.modeling import get_models, _fit_candidate
+
+METRICS = ('r2', 'rmse', 'mae')
+
+def _save_matrix(path, X):
+    if hasattr(X, 'tocsr'):
+        X = X.tocsr()
+        for part in ('data', 'indices', 'indptr'):
+            np.save(f'{path}.{part}.npy', getattr(X, part))
+        np.save(f'{path}.shape.npy', np.asarray(X.shape))
+    else:
+        np.save(f'{path}.npy', np.ascontiguousarray(X.to_numpy() if hasattr(X, 'to_numpy') else X))
+
+def _load_matrix(path):
+    if os.path.exists(f'{path}.npy'):
+        return np.load(f'{path}.npy', mmap_mode='r')
+    from scipy import sparse as sp
+    parts = [np.load(f'{path}.{part}.npy', mmap_mode='r') for part in ('data', 'indices', 'indptr')]
+    return sp.csr_matrix(tuple(parts), shape=tuple(np.load(f'{path}.shape.npy')), copy=False)
+
+@timed('prepare_folds')
+def prepare_folds(df, directory, n_splits=5, target=TARGET, random_state=42, sparse=False,
+                  max_categories=None, min_frequency=None):
+    """Preprocess each fold once into `directory`; returns the fold paths.
+
+    Each path is a prefix for `<path>.X_train`, `.X_test`, `.y_train` and
+    `.y_test`; load them with load_fold().
+    """
+    from sklearn.model_selection import KFold
+    X, y = model_inputs(df, target)
+    y = y.to_numpy(dtype=np.float64)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, (train_idx, test_idx) in enumerate(KFold(n_splits, shuffle=True, random_state=random_state).split(X)):
+        X_train, artifacts = fit_preprocessing(X.iloc[train_idx], sparse, max_categories, min_frequency)
+        X_test = transform_features(X.iloc[test_idx], artifacts)
+        path = os.path.join(directory, f'fold{i}')
+        _save_matrix(f'{path}.X_train', X_train)
+        _save_matrix(f'{path}.X_test', X_test)
+        np.save(f'{path}.y_train.npy', y[train_idx])
+        np.save(f'{path}.y_test.npy', y[test_idx])
+        paths.append(path)
+    return paths
+
+def load_fold(path):
+    """(X_train, X_test, y_train, y_test) of a prepared fold, memory-mapped read-only."""
+    return (_load_matrix(f'{path}.X_train'), _load_matrix(f'{path}.X_test'),
+            np.load(f'{path}.y_train.npy', mmap_mode='r'), np.load(f'{path}.y_test.npy', mmap_mode='r'))
+
+def _evaluate_fold(name, model, fold, path, inner_jobs, deadline, random_state):
+    X_train, X_test, y_train, y_test = load_fold(path)
+    _, res = _fit_candidate(name, model, X_train, y_train, X_test, y_test, None, None, 0, inner_jobs, deadline,
+                            random_state)
+    if res is None:
+        return name, fold, None
+    # Only the metrics travel back to the parent; the fold's fitted model is discarded
+    metrics = res['metrics']
+    best_iteration = getattr(res['model'], 'best_iteration', None) if name == 'XGBoost' else None
+    if best_iteration is not None:
+        metrics['best_iteration'] = int(best_iteration)
+    return name, fold, metrics
+
+def _summarize(fold_metrics):
+    summary = {}
+    for m in METRICS:
+        values = np.array([f[m] for f in fold_metrics], dtype=float)
+        summary[m] = float(values.mean())
+        summary[f'{m}_std'] = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+    summary['fit_time'] = float(sum(f['fit_time'] for f in fold_metrics))
+    return summary
+
+def _refit(name, model, X, y, fold_metrics, n_jobs):
+    if 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=n_jobs)
+    rounds = [f['best_iteration'] for f in fold_metrics if 'best_iteration' in f]
+    if name == 'XGBoost' and rounds:
+        # No rows are held out for early stopping; use the round count the folds settled on
+        model.set_params(n_estimators=int(round(np.mean(rounds))) + 1, early_stopping_rounds=None)
+    return model.fit(X, y)
+
+def select_model_cv(df, n_splits=5, n_jobs=1, time_budget=None, target=TARGET, random_state=42, sparse=False,
+                    max_categories=None, min_frequency=None, cache_dir=None):
+    """Pick the model with the lowest mean K-fold RMSE and refit it on all rows.
+
+    `n_jobs` is the total core budget (-1 = all cores), split between
+    concurrent (model, fold) jobs and each model's own threads. Fold matrices
+    go to `cache_dir` (kept) or a temporary directory (removed afterwards).
+    With `time_budget` seconds, jobs not started in time are skipped and
+    models missing any fold are dropped. Returns (results, best_name,
+    best_model, artifacts); results[name] has 'metrics' (mean, *_std and
+    total fit_time) and 'folds'.
+    """
+    from sklearn.base import clone
+    models = get_models(random_state=random_state)
+    cores = (os.cpu_count() or 1) if n_jobs is None or n_jobs < 1 else n_jobs
+    outer = max(1, min(len(models) * n_splits, cores))
+    inner = max(1, cores // outer)
+    directory = cache_dir or tempfile.mkdtemp(prefix='cmm-folds-')
+    try:
+        paths = prepare_folds(df, directory, n_splits, target, random_state, sparse, max_categories, min_frequency)
+        deadline = time.time() + time_budget if time_budget else None
+        # Models are the inner loop so that each fold's files are hot while its jobs run
+        jobs = (delayed(_evaluate_fold)(name, clone(model), fold, path, inner, deadline, random_state)
+                for fold, path in enumerate(paths) for name, model in models.items())
+        with parallel_backend('loky', inner_max_num_threads=inner):
+            evaluated = Parallel(n_jobs=outer)(jobs)
+    finally:
+        if cache_dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    folds = {name: [None] * n_splits for name in models}
+    for name, fold, metrics in evaluated:
+        folds[name][fold] = metrics
+    skipped = [name for name, fm in folds.items() if any(m is None for m in fm)]
+    if skipped:
+        warnings.warn(f"Time budget exhausted; skipped {', '.join(skipped)}")
+    results = {name: {'metrics': _summarize(fm), 'folds': fm} for name, fm in folds.items() if name not in skipped}
+    if not results:
+        raise RuntimeError('No model finished all folds within the time budget.')
+    best_name = min(results, key=lambda k: results[k]['metrics']['rmse'])
+
+    X, y = model_inputs(df, target)
+    X, artifacts = fit_preprocessing(X, sparse, max_categories, min_frequency)
+    if 'date' in df.columns:
+        artifacts['reference_date'] = df['date'].max()
+    best_model = _refit(best_name, models[best_name], X, y, results[best_name]['folds'], cores)
+    results[best_name]['model'] = best_model
+    return results, best_name, best_model, artifacts
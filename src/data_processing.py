@@ -1,70 +1,300 @@
+import os
+import hashlib
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.impute import SimpleImputer
+from src.instrumentation import incr, timed
+# scikit-learn and SciPy are imported inside the functions that need them, so
+# scoring processes only pay for them once a bundle is actually loaded.
 
-def load_data(path):
-    df = pd.read_csv(path, parse_dates=['date'], low_memory=False)
+TARGET = 'ad_revenue_usd'
+ID_COLS = ['video_id', 'date']
+
+NUMERIC_COLS = ['views','likes','comments','watch_time_minutes','video_length_minutes','subscribers']
+CATEGORICAL_COLS = ['category','device','country']
+
+# Declared column types for the raw export; bump SCHEMA_VERSION when it changes
+# so stale Parquet caches are not reused.
+SCHEMA = {
+    **{c: 'float32' for c in NUMERIC_COLS},
+    TARGET: 'float64',
+    **{c: 'category' for c in CATEGORICAL_COLS},
+    'video_id': 'string',
+}
+SCHEMA_VERSION = 1
+PARQUET_CACHE_DIR = os.environ.get('CMM_PARQUET_CACHE', 'data/.parquet_cache')
+
+def _parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def file_fingerprint(path, block_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _read_csv(path, schema=SCHEMA, engine=None, **kwargs):
+    options = {'parse_dates': ['date']}
+    if engine == 'pyarrow':
+        options['engine'] = 'pyarrow'
+    else:
+        options['low_memory'] = False
+    try:
+        return pd.read_csv(path, dtype=schema, **options, **kwargs)
+    except (ValueError, TypeError):
+        # Malformed numerics: read them untyped and let basic_cleaning coerce them
+        return pd.read_csv(path, dtype=_loose_schema(schema), **options, **kwargs)
+
+def _loose_schema(schema):
+    return {c: t for c, t in schema.items() if t in ('category', 'string')}
+
+def _coerce_numerics(df, schema):
+    for c, t in schema.items():
+        if c in df.columns and t not in ('category', 'string') and df[c].dtype != t:
+            df[c] = pd.to_numeric(df[c], errors='coerce').astype(t)
     return df
 
-def basic_cleaning(df):
-    df = df.copy()
+def read_csv_chunks(path, chunksize, schema=SCHEMA):
+    """Typed chunks of a CSV; from the first chunk with a malformed numeric on, values are coerced to NaN."""
+    done = 0
+    try:
+        for chunk in pd.read_csv(path, dtype=schema, parse_dates=['date'], chunksize=chunksize):
+            yield chunk
+            done += len(chunk)
+        return
+    except (ValueError, TypeError):
+        pass
+    # Same loose fallback as _read_csv, resumed after the rows already yielded
+    for chunk in pd.read_csv(path, dtype=_loose_schema(schema), parse_dates=['date'], chunksize=chunksize,
+                             skiprows=range(1, done + 1)):
+        yield _coerce_numerics(chunk, schema)
+
+@timed('load_data')
+def load_data(path, schema=SCHEMA, engine=None, cache_dir=PARQUET_CACHE_DIR):
+    """Load the raw export with a pinned schema.
+
+    CSVs are parsed once and cached as Parquet under `cache_dir`, keyed by a
+    hash of the file contents, so later runs skip CSV parsing. Pass
+    engine='pyarrow' for the multi-threaded Arrow CSV reader, or cache_dir=None
+    to disable the cache. Parquet inputs are read directly.
+    """
+    if str(path).endswith('.parquet'):
+        return pd.read_parquet(path)
+    if not cache_dir or not _parquet_available():
+        return _read_csv(path, schema, engine)
+    cache_path = os.path.join(cache_dir, f"{file_fingerprint(path)}-v{SCHEMA_VERSION}.parquet")
+    if os.path.exists(cache_path):
+        incr('parquet_cache_hits')
+        return pd.read_parquet(cache_path)
+    incr('parquet_cache_misses')
+    df = _read_csv(path, schema, engine)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    return df
+
+@timed('basic_cleaning')
+def basic_cleaning(df, copy=True):
+    if copy:
+        df = df.copy()
     # Drop fully empty columns
-    df = df.dropna(axis=1, how='all')
-    # Remove duplicates (~2% expected)
-    df = df.drop_duplicates()
-    # Ensure numeric types
-    num_cols = ['views','likes','comments','watch_time_minutes','video_length_minutes','subscribers','ad_revenue_usd']
-    for c in num_cols:
-        if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors='coerce')
+    empty = df.columns[df.isna().all()]
+    if len(empty):
+        df = df.drop(columns=empty)
+    # Remove duplicates (~2% expected); only re-materialize when there are any
+    dup = df.duplicated()
+    if dup.any():
+        # Dropping in place keeps `df` an owned frame; a boolean slice would be flagged as a
+        # copy and warn on every in-place assignment below and in feature_engineering(copy=False)
+        if df.index.is_unique:
+            df.drop(index=df.index[dup.to_numpy()], inplace=True)
+        else:
+            df = df[~dup.to_numpy()].copy()
+    # Ensure numeric types; columns loaded with the schema are already typed
+    for c in NUMERIC_COLS + [TARGET]:
+        if c in df.columns and not pd.api.types.is_numeric_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], errors='coerce').astype(SCHEMA[c])
+    for c in CATEGORICAL_COLS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype('category')
     return df
 
-def feature_engineering(df):
-    df = df.copy()
+def _column(df, name):
+    if name in df.columns:
+        return df[name].to_numpy(dtype=np.float32 if df[name].dtype == np.float32 else np.float64, na_value=np.nan)
+    return np.zeros(len(df), dtype=np.float32)
+
+def _safe_divide(num, den, zero_num_is_nan=False):
+    # NaN wherever the denominator (or, optionally, numerator) is zero or the result is infinite
+    out = np.full(num.shape, np.nan, dtype=np.result_type(num, den, np.float32))
+    mask = den != 0
+    if zero_num_is_nan:
+        mask &= num != 0
+    np.divide(num, den, out=out, where=mask)
+    out[np.isinf(out)] = np.nan
+    return out
+
+@timed('feature_engineering')
+def feature_engineering(df, reference_date=None, copy=True):
+    """Add engagement, watch_time_per_view, video_age_days and length_to_watch_ratio.
+
+    With copy=False the columns are added to `df` in place, so the frame is
+    never duplicated; each ratio is a single masked NumPy division.
+    """
+    if copy:
+        df = df.copy()
+    views = _column(df, 'views')
+    watch = _column(df, 'watch_time_minutes')
     # Engagement rate
-    df['engagement'] = (df.get('likes',0).fillna(0) + df.get('comments',0).fillna(0)) / df['views'].replace(0,np.nan)
-    df['watch_time_per_view'] = df['watch_time_minutes'] / df['views'].replace(0,np.nan)
-    # Age of video in days from upload/report date relative to the max date
+    likes, comments = _column(df, 'likes'), _column(df, 'comments')
+    interactions = np.nan_to_num(likes, nan=0.0) + np.nan_to_num(comments, nan=0.0)
+    df['engagement'] = _safe_divide(interactions, views)
+    df['watch_time_per_view'] = _safe_divide(watch, views)
+    # Age of video in days from upload/report date relative to the reference (default: max) date
     if 'date' in df.columns:
-        df['video_age_days'] = (df['date'].max() - df['date']).dt.days
+        ref = pd.Timestamp(reference_date) if reference_date is not None else df['date'].max()
+        df['video_age_days'] = (ref - df['date']).dt.days
     # Length ratio
-    df['length_to_watch_ratio'] = df['video_length_minutes'].replace(0,np.nan) / df['watch_time_minutes'].replace(0,np.nan)
-    # Fill infs and large values
-    df = df.replace([np.inf, -np.inf], np.nan)
+    df['length_to_watch_ratio'] = _safe_divide(_column(df, 'video_length_minutes'), watch, zero_num_is_nan=True)
+    # Infs in the raw numeric inputs become missing values as well
+    for c in NUMERIC_COLS + [TARGET]:
+        if c in df.columns and pd.api.types.is_float_dtype(df[c]):
+            values = df[c].to_numpy()
+            if np.isinf(values).any():
+                df[c] = df[c].replace([np.inf, -np.inf], np.nan)
     return df
 
-def preprocess_for_model(df, target='ad_revenue_usd', test_size=0.2, random_state=42):
-    df = df.copy()
-    # Select features
-    drop_cols = ['video_id','date']
-    X = df.drop(columns=[c for c in drop_cols if c in df.columns] + [target])
-    y = df[target]
+def _one_hot_encoder(sparse=False, max_categories=None, min_frequency=None):
+    from sklearn.preprocessing import OneHotEncoder
+    kwargs = {'handle_unknown': 'ignore'}
+    if max_categories is not None or min_frequency is not None:
+        # Rare and unseen categories share one "<col>_infrequent_sklearn" (other) column
+        kwargs.update(max_categories=max_categories, min_frequency=min_frequency,
+                      handle_unknown='infrequent_if_exist')
+    # `sparse` was renamed to `sparse_output` in scikit-learn 1.2
+    try:
+        return OneHotEncoder(sparse_output=sparse, **kwargs)
+    except TypeError:
+        return OneHotEncoder(sparse=sparse, **kwargs)
 
-    # Identify numerical and categorical
-    num_cols = X.select_dtypes(include=['number']).columns.tolist()
-    cat_cols = X.select_dtypes(include=['object','category']).columns.tolist()
+def build_preprocessor(num_cols, cat_cols, sparse=False, max_categories=None, min_frequency=None):
+    from sklearn.compose import ColumnTransformer
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    # Only the numeric block is scaled: centering one-hot columns would destroy sparsity
+    num_pipe = Pipeline([('imputer', SimpleImputer(strategy='median')), ('scaler', StandardScaler())])
+    encoder = _one_hot_encoder(sparse, max_categories, min_frequency)
+    cat_pipe = Pipeline([('imputer', SimpleImputer(strategy='most_frequent')), ('encoder', encoder)])
+    return ColumnTransformer(
+        [('num', num_pipe, num_cols), ('cat', cat_pipe, cat_cols)],
+        sparse_threshold=1.0 if sparse else 0.0,
+        verbose_feature_names_out=False,
+    )
 
-    # Impute numerical
-    num_imputer = SimpleImputer(strategy='median')
-    X_num = pd.DataFrame(num_imputer.fit_transform(X[num_cols]), columns=num_cols)
+def split_feature_columns(X, exclude=()):
+    # Works off dtypes only, so no column data is copied
+    num_cols, cat_cols = [], []
+    for c, t in X.dtypes.items():
+        if c in exclude:
+            continue
+        if pd.api.types.is_numeric_dtype(t) and not pd.api.types.is_bool_dtype(t):
+            num_cols.append(c)
+        elif t == object or isinstance(t, pd.CategoricalDtype):
+            cat_cols.append(c)
+    return num_cols, cat_cols
 
-    # Impute categorical
-    cat_imputer = SimpleImputer(strategy='most_frequent')
-    X_cat = pd.DataFrame(cat_imputer.fit_transform(X[cat_cols]), columns=cat_cols)
+def _as_model_matrix(Xt, feature_columns, index):
+    from scipy import sparse as sp
+    if sp.issparse(Xt):
+        return Xt.tocsr()
+    return pd.DataFrame(Xt, columns=feature_columns, index=index)
 
-    # One-hot encode categorical (limit to top categories to avoid explosion)
-    enc = OneHotEncoder(handle_unknown='ignore', sparse=False)
-    X_cat_enc = pd.DataFrame(enc.fit_transform(X_cat), columns=enc.get_feature_names_out(cat_cols))
+def model_inputs(df, target=TARGET):
+    """The raw feature columns (numeric then categorical) and the target."""
+    num_cols, cat_cols = split_feature_columns(df, exclude=set(ID_COLS) | {target})
+    return df[num_cols + cat_cols], df[target]
 
-    # Combine
-    X_combined = pd.concat([X_num.reset_index(drop=True), X_cat_enc.reset_index(drop=True)], axis=1)
+def fit_preprocessing(X, sparse=False, max_categories=None, min_frequency=None):
+    """Fit the preprocessing ColumnTransformer on `X`; returns (model matrix, artifacts)."""
+    num_cols, cat_cols = split_feature_columns(X)
+    # Impute, scale numerics and one-hot encode categoricals in one fitted transformer
+    preprocessor = build_preprocessor(num_cols, cat_cols, sparse, max_categories, min_frequency)
+    Xt = preprocessor.fit_transform(X)
+    feature_columns = list(preprocessor.get_feature_names_out())
+    artifacts = {'preprocessor': preprocessor, 'num_cols': num_cols, 'cat_cols': cat_cols, 'feature_columns': feature_columns}
+    return _as_model_matrix(Xt, feature_columns, X.index), artifacts
 
-    # Scaling
-    scaler = StandardScaler()
-    X_scaled = pd.DataFrame(scaler.fit_transform(X_combined), columns=X_combined.columns)
+@timed('preprocess_for_model')
+def preprocess_for_model(df, target=TARGET, test_size=0.2, random_state=42, sparse=False,
+                         max_categories=None, min_frequency=None):
+    """Split and fit the preprocessing ColumnTransformer on the training rows.
 
-    X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=test_size, random_state=random_state)
-    artifacts = {'num_imputer': num_imputer, 'cat_imputer': cat_imputer, 'encoder': enc, 'scaler': scaler, 'feature_columns': X_scaled.columns.tolist()}
+    With sparse=True the matrices are CSR (one-hot columns stay sparse, numeric
+    columns are scaled); otherwise they are DataFrames. `max_categories` /
+    `min_frequency` cap each categorical, folding the rest into an "other"
+    column.
+    """
+    from sklearn.model_selection import train_test_split
+    X, y = model_inputs(df, target)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=random_state)
+    X_train, artifacts = fit_preprocessing(X_train, sparse, max_categories, min_frequency)
+    X_test = transform_features(X_test, artifacts)
+    if 'date' in df.columns:
+        # Scoring reuses the training reference date so video_age_days means the same thing
+        artifacts['reference_date'] = df['date'].max()
     return X_train, X_test, y_train, y_test, artifacts
+
+def _legacy_transform(df, artifacts):
+    # Bundles saved before the ColumnTransformer: replay the separately fitted steps
+    num_imputer, cat_imputer = artifacts['num_imputer'], artifacts['cat_imputer']
+    num_cols = list(num_imputer.feature_names_in_)
+    cat_cols = list(cat_imputer.feature_names_in_)
+    X = df.reindex(columns=num_cols + cat_cols)
+    X_num = num_imputer.transform(X[num_cols])
+    X_cat = pd.DataFrame(cat_imputer.transform(X[cat_cols].astype(object)), columns=cat_cols)
+    X_cat = artifacts['encoder'].transform(X_cat)
+    X_combined = pd.DataFrame(np.hstack([X_num, X_cat]), columns=artifacts['feature_columns'])
+    return pd.DataFrame(artifacts['scaler'].transform(X_combined), columns=artifacts['feature_columns'], index=df.index)
+
+@timed('transform_features')
+def transform_features(df, artifacts):
+    """Turn feature-engineered rows into the model matrix with the fitted preprocessor.
+
+    Works on one row or a whole batch; missing input columns are imputed.
+    Returns a DataFrame, or a CSR matrix for bundles trained with sparse=True.
+    """
+    preprocessor = artifacts.get('preprocessor')
+    if preprocessor is None:
+        return _legacy_transform(df, artifacts)
+    X = df.reindex(columns=artifacts['num_cols'] + artifacts['cat_cols'])
+    return _as_model_matrix(preprocessor.transform(X), artifacts['feature_columns'], df.index)
+
+def scoring_reference_date(artifacts, reference_date=None):
+    """Date video_age_days is measured from when scoring: `reference_date`, else the
+    bundle's training reference date, else today (UTC) for bundles without one."""
+    if reference_date is not None:
+        return pd.Timestamp(reference_date)
+    if artifacts.get('reference_date') is not None:
+        return pd.Timestamp(artifacts['reference_date'])
+    return pd.Timestamp.now('UTC').tz_localize(None).normalize()
+
+def raw_to_model_matrix(df, artifacts, reference_date=None):
+    """Raw scoring rows -> model matrix, shared by batch scoring, serving and explanations.
+
+    Malformed numerics become NaN and date strings are parsed (tz-aware ones
+    as naive UTC) before feature_engineering and transform_features.
+    """
+    df = df.copy()
+    for c in NUMERIC_COLS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors='coerce')
+    if 'date' in df.columns and not pd.api.types.is_datetime64_dtype(df['date']):
+        df['date'] = pd.to_datetime(df['date'], utc=True, errors='coerce').dt.tz_localize(None)
+    ref = scoring_reference_date(artifacts, reference_date)
+    return transform_features(feature_engineering(df, reference_date=ref, copy=False), artifacts)
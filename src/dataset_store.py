@@ -0,0 +1,271 @@
+# src/dataset_store.py
+"""Incrementally updated training set: date-partitioned Parquet with a video_id index.
+
+    store = DatasetStore('data/store')
+    store.upsert(daily_increment_df)     # or store.ingest('data/increment.csv')
+    df = store.load()                    # cleaned + feature-engineered rows
+
+Layout under the store root:
+
+    raw/<partition>.parquet        typed raw rows, one file per date partition
+    features/<partition>.parquet   the same rows after feature_engineering
+    index.parquet                  video_id -> partition
+    meta.json                      reference date, partition versions
+
+upsert() replaces rows by video_id (a video that moved to another date is
+removed from its old partition), so the full-frame drop_duplicates of
+basic_cleaning is never rerun over all history. Each rewrite bumps the
+partition's version; load() recomputes features only for partitions whose
+cached features are older, or were built for another reference date.
+
+video_age_days is measured from the stored reference date, set to the
+newest date of the first ingest, instead of the max date of whatever frame is
+loaded, so cached features stay valid as data arrives. set_reference_date()
+moves it and invalidates every feature partition.
+
+Usage:
+    python -m src.dataset_store ingest data/store data/increment.csv
+    python -m src.dataset_store info data/store
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from src.data_processing import (
+    SCHEMA, NUMERIC_COLS, CATEGORICAL_COLS, TARGET, feature_engineering, load_data,
+)
+from src.instrumentation import incr, timed
+
+FORMAT_VERSION = 1
+UNDATED = 'undated'
+
+def _write_parquet(df, path):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+def _typed(df):
+    # Pin the declared schema per row block; categoricals are restored after concatenation
+    df = df.copy()
+    for c in NUMERIC_COLS + [TARGET]:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors='coerce').astype(SCHEMA[c])
+    for c in CATEGORICAL_COLS:
+        if c in df.columns:
+            df[c] = df[c].astype(object).where(df[c].notna(), None)
+    df['video_id'] = df['video_id'].astype('string')
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    return df
+
+def _as_categories(df):
+    for c in CATEGORICAL_COLS:
+        if c in df.columns:
+            df[c] = df[c].astype('category')
+    return df
+
+class DatasetStore:
+    """Date-partitioned Parquet store of raw rows and their cached features.
+
+    `freq` is the partition granularity as a pandas period alias ('D' for one
+    file per day, 'M' per month); it is fixed when the store is created.
+    Writers are expected to be one process at a time; every file is replaced
+    atomically, meta.json last.
+    """
+
+    def __init__(self, root, freq='D'):
+        self.root = root
+        self._meta_path = os.path.join(root, 'meta.json')
+        self._index_path = os.path.join(root, 'index.parquet')
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, encoding='utf-8') as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'format_version': FORMAT_VERSION, 'freq': freq, 'reference_date': None,
+                         'partitions': {}, 'features': {}}
+        self.freq = self.meta['freq']
+        self._index = None
+        for sub in ('raw', 'features'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    @property
+    def reference_date(self):
+        ref = self.meta['reference_date']
+        return pd.Timestamp(ref) if ref else None
+
+    @property
+    def partitions(self):
+        return sorted(self.meta['partitions'])
+
+    def _path(self, kind, key):
+        return os.path.join(self.root, kind, f'{key}.parquet')
+
+    def _save_meta(self):
+        tmp = f'{self._meta_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=1, sort_keys=True)
+        os.replace(tmp, self._meta_path)
+
+    def index(self):
+        """video_id -> partition key, as a Series indexed by video_id."""
+        if self._index is None:
+            if os.path.exists(self._index_path):
+                idx = pd.read_parquet(self._index_path)
+                self._index = pd.Series(idx['partition'].to_numpy(), index=idx['video_id'].to_numpy())
+            else:
+                self._index = pd.Series([], dtype=object)
+        return self._index
+
+    def _partition_keys(self, dates):
+        keys = dates.dt.to_period(self.freq).astype(str).to_numpy(dtype=object)
+        keys[dates.isna().to_numpy()] = UNDATED
+        return keys
+
+    @timed('store_upsert')
+    def upsert(self, df):
+        """Insert new videos and replace existing ones by video_id; returns the rewritten partitions."""
+        df = _typed(df[df['video_id'].notna()])
+        # Within one increment the last row for a video wins
+        df = df.drop_duplicates('video_id', keep='last')
+        if df.empty:
+            return []
+        keys = self._partition_keys(df['date'])
+        index = self.index()
+        ids = df['video_id'].to_numpy(dtype=object)
+        previous = index.reindex(ids).to_numpy(dtype=object)
+        # Partitions losing a video to another date have to be rewritten as well
+        moved = pd.notna(previous) & (previous != keys)
+        touched = sorted(set(keys) | set(previous[moved]))
+        new_by_key = dict(tuple(df.groupby(keys, sort=False)))
+        incoming = set(ids)
+
+        for key in touched:
+            path = self._path('raw', key)
+            parts = []
+            if os.path.exists(path):
+                old = pd.read_parquet(path)
+                parts.append(old[~old['video_id'].isin(incoming)])
+            if key in new_by_key:
+                parts.append(new_by_key[key])
+            merged = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+            if merged.empty:
+                for kind in ('raw', 'features'):
+                    if os.path.exists(self._path(kind, key)):
+                        os.remove(self._path(kind, key))
+                self.meta['partitions'].pop(key, None)
+                self.meta['features'].pop(key, None)
+                continue
+            _write_parquet(_typed(merged), path)
+            info = self.meta['partitions'].get(key, {'version': 0})
+            self.meta['partitions'][key] = {'version': info['version'] + 1, 'rows': len(merged)}
+
+        updated = pd.Series(keys, index=ids)
+        index = pd.concat([index[~index.index.isin(incoming)], updated])
+        _write_parquet(pd.DataFrame({'video_id': index.index.astype(str), 'partition': index.to_numpy(dtype=str)}),
+                       self._index_path)
+        self._index = index
+        if self.meta['reference_date'] is None and df['date'].notna().any():
+            self.meta['reference_date'] = df['date'].max().isoformat()
+        self._save_meta()
+        incr('store_rows_upserted', len(df))
+        return touched
+
+    def ingest(self, path):
+        """upsert() a CSV or Parquet export; returns the rewritten partitions."""
+        return self.upsert(load_data(path, cache_dir=None))
+
+    def set_reference_date(self, date):
+        """Measure video_age_days from `date`; every feature partition is rebuilt on the next load()."""
+        self.meta['reference_date'] = pd.Timestamp(date).isoformat()
+        self._save_meta()
+
+    def stale_partitions(self):
+        """Partitions whose cached features are missing or out of date."""
+        ref = self.meta['reference_date']
+        stale = []
+        for key, info in self.meta['partitions'].items():
+            cached = self.meta['features'].get(key)
+            if (cached is None or cached['version'] != info['version'] or cached['reference_date'] != ref
+                    or not os.path.exists(self._path('features', key))):
+                stale.append(key)
+        return sorted(stale)
+
+    @timed('store_refresh_features')
+    def refresh_features(self):
+        """Compute features for stale partitions only; returns the partitions rebuilt."""
+        stale = self.stale_partitions()
+        for key in stale:
+            raw = _as_categories(pd.read_parquet(self._path('raw', key)))
+            features = feature_engineering(raw, reference_date=self.reference_date, copy=False)
+            _write_parquet(features, self._path('features', key))
+            self.meta['features'][key] = {'version': self.meta['partitions'][key]['version'],
+                                          'reference_date': self.meta['reference_date']}
+        if stale:
+            self._save_meta()
+        incr('store_partitions_rebuilt', len(stale))
+        incr('store_partitions_cached', len(self.meta['partitions']) - len(stale))
+        return stale
+
+    @timed('store_load')
+    def load(self, features=True, columns=None, start=None, end=None):
+        """All rows (optionally only partitions whose date is within [start, end]).
+
+        With features=True stale feature partitions are rebuilt first and the
+        feature-engineered rows are returned; otherwise the raw rows.
+        """
+        if features:
+            self.refresh_features()
+        keys = self.partitions
+        if start is not None or end is not None:
+            lo = pd.Period(start, self.freq) if start is not None else None
+            hi = pd.Period(end, self.freq) if end is not None else None
+            keys = [k for k in keys if k != UNDATED and (lo is None or pd.Period(k, self.freq) >= lo)
+                    and (hi is None or pd.Period(k, self.freq) <= hi)]
+        if not keys:
+            return pd.DataFrame(columns=columns)
+        import pyarrow.parquet as pq
+        kind = 'features' if features else 'raw'
+        # One multi-threaded Arrow read over all partition files instead of a pandas read per file
+        table = pq.read_table([self._path(kind, k) for k in keys], columns=columns)
+        return _as_categories(table.to_pandas())
+
+    def fingerprint(self):
+        """Changes whenever any partition is rewritten or the reference date moves."""
+        state = json.dumps([self.meta['partitions'], self.meta['reference_date']], sort_keys=True)
+        return hashlib.blake2b(state.encode(), digest_size=16).hexdigest()
+
+    def info(self):
+        rows = sum(p['rows'] for p in self.meta['partitions'].values())
+        return {'root': self.root, 'freq': self.freq, 'reference_date': self.meta['reference_date'],
+                'partitions': len(self.meta['partitions']), 'rows': rows,
+                'stale_partitions': len(self.stale_partitions())}
+
+def main():
+    p = argparse.ArgumentParser(description='Maintain the incremental training dataset store')
+    sub = p.add_subparsers(dest='cmd', required=True)
+    i = sub.add_parser('ingest', help='Upsert a CSV/Parquet export into the store')
+    i.add_argument('store')
+    i.add_argument('paths', nargs='+')
+    i.add_argument('--freq', default='D', help="Partition granularity for a new store ('D' or 'M')")
+    r = sub.add_parser('reference-date', help='Set the date video_age_days is measured from')
+    r.add_argument('store')
+    r.add_argument('date')
+    s = sub.add_parser('info', help='Partition and row counts')
+    s.add_argument('store')
+    args = p.parse_args()
+    store = DatasetStore(args.store, freq=getattr(args, 'freq', 'D'))
+    if args.cmd == 'ingest':
+        for path in args.paths:
+            touched = store.ingest(path)
+            print(f'{path}: rewrote {len(touched)} partition(s)')
+        print('Rebuilt features for', len(store.refresh_features()), 'partition(s)')
+    elif args.cmd == 'reference-date':
+        store.set_reference_date(args.date)
+        print('Reference date set to', store.reference_date.date())
+    print(json.dumps(store.info(), indent=1))
+
+if __name__ == '__main__':
+    main()
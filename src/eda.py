@@ -0,0 +1,234 @@
+# src/eda.py
+"""Single-pass EDA over chunks with mergeable accumulators.
+
+EDAStats.update(chunk) folds one chunk into:
+
+- pairwise co-moments of the numeric columns (count, means, centered sums of
+  squares and cross-products over the rows where both columns are present),
+  merged across chunks with Chan's parallel update. The diagonal gives each
+  column's Welford mean/variance; the off-diagonal gives the same pairwise
+  Pearson correlations as DataFrame.corr();
+- a merging t-digest per numeric column for the quartiles;
+- exact min/max, missing counts and categorical value counts;
+- optionally a fixed-size uniform reservoir sample of rows for plotting.
+
+Two EDAStats built on different chunks merge() into the stats of both, so
+chunks can also be profiled in separate processes. Non-finite values count as
+missing.
+
+    stats = profile_chunks(read_csv_chunks(path, 100_000), sample_size=50_000)
+    stats.summary()        # like df.describe().T
+    stats.missing()        # like df.isna().mean() * 100
+    stats.correlation()    # like df[num_cols].corr()
+
+cached_profile() stores the result under a key derived from the dataset's
+fingerprint, so rerunning the notebook on an unchanged export skips the pass.
+"""
+import hashlib
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.data_processing import ID_COLS, split_feature_columns
+from src.instrumentation import timed
+
+EDA_FORMAT_VERSION = 1
+EDA_CACHE_DIR = os.environ.get('CMM_EDA_CACHE', 'data/.eda_cache')
+QUANTILES = (0.25, 0.5, 0.75)
+DIGEST_COMPRESSION = 200
+
+class _Digest:
+    """Merging t-digest: weighted centroids, small near the tails (k1 arcsine scale)."""
+
+    def __init__(self, compression=DIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    def _compress(self, means, weights):
+        # `means` sorted; neighbours falling in the same unit of the scale function are merged
+        q_mid = (np.cumsum(weights) - weights / 2) / weights.sum()
+        bucket = np.floor(self.compression / (2 * np.pi) * (np.arcsin(2 * q_mid - 1) + np.pi / 2)).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        w = np.add.reduceat(weights, starts)
+        return np.add.reduceat(means * weights, starts) / w, w
+
+    def add(self, values):
+        if len(values):
+            # Compress the chunk on its own first, so only ~compression centroids are merged
+            self.merge_centroids(*self._compress(np.sort(values), np.ones(len(values))))
+
+    def merge_centroids(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind='stable')
+        self.means, self.weights = self._compress(means[order], weights[order])
+
+    def quantile(self, qs, lo, hi):
+        if not len(self.weights):
+            return np.full(len(qs), np.nan)
+        total = self.weights.sum()
+        positions = np.concatenate([[0.0], np.cumsum(self.weights) - self.weights / 2, [total]])
+        values = np.concatenate([[lo], self.means, [hi]])
+        return np.interp(np.asarray(qs) * total, positions, values)
+
+class EDAStats:
+    """Mergeable summary statistics of a frame seen chunk by chunk."""
+
+    def __init__(self, num_cols, cat_cols, columns, sample_size=0, random_state=0):
+        self.num_cols = list(num_cols)
+        self.cat_cols = list(cat_cols)
+        self.columns = list(columns)
+        k = len(self.num_cols)
+        self.rows = 0
+        self.n = np.zeros((k, k))          # rows where both columns are present
+        self.mean = np.zeros((k, k))       # mean[i, j]: mean of column i over those rows
+        self.m2 = np.zeros((k, k))         # m2[i, j]: sum of squared deviations of column i over those rows
+        self.comoment = np.zeros((k, k))   # sum of (x_i - mean_i)(x_j - mean_j) over those rows
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+        self.digests = [_Digest() for _ in range(k)]
+        self.missing_counts = pd.Series(0, index=self.columns, dtype=np.int64)
+        self.value_counts = {c: pd.Series(dtype=np.int64) for c in self.cat_cols}
+        self.sample_size = sample_size
+        self.sample = None
+        self._sample_keys = None
+        self._rng = np.random.default_rng(random_state)
+
+    def _merge_moments(self, n, mean, m2, comoment):
+        total = self.n + n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = mean - self.mean
+            weight = np.where(total > 0, self.n * n / total, 0.0)
+            self.comoment += comoment + delta * delta.T * weight
+            self.m2 += m2 + delta ** 2 * weight
+            self.mean += np.where(total > 0, delta * n / total, 0.0)
+        self.n = total
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        self.missing_counts = self.missing_counts.add(chunk.isna().sum(), fill_value=0)
+        X = chunk.reindex(columns=self.num_cols).to_numpy(dtype=np.float64, na_value=np.nan)
+        present = np.isfinite(X)
+        # Non-finite values (inf) are also counted as missing
+        self.missing_counts[self.num_cols] += (~present & ~np.isnan(X)).sum(axis=0)
+        Xc = np.where(present, X, 0.0)
+        if len(X):
+            self.min = np.minimum(self.min, np.where(present, X, np.inf).min(axis=0))
+            self.max = np.maximum(self.max, np.where(present, X, -np.inf).max(axis=0))
+            for i, digest in enumerate(self.digests):
+                digest.add(X[present[:, i], i])
+            # Shift by the chunk's column means first so the sums below do not cancel
+            counts = present.sum(axis=0)
+            shift = np.divide(Xc.sum(axis=0), counts, out=np.zeros(len(counts)), where=counts > 0)
+            Xc = np.where(present, X - shift, 0.0)
+            M = present.astype(np.float64)
+            n = M.T @ M
+            s = Xc.T @ M                       # s[i, j]: sum of column i over rows where j is present too
+            ss = (Xc ** 2).T @ M
+            sxy = Xc.T @ Xc
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean_c = np.where(n > 0, s / n, 0.0)
+                m2 = np.where(n > 0, ss - s * mean_c, 0.0)
+                comoment = np.where(n > 0, sxy - s * mean_c.T, 0.0)
+            self._merge_moments(n, mean_c + shift[:, None], m2, comoment)
+        for c in self.cat_cols:
+            if c in chunk.columns:
+                self.value_counts[c] = self.value_counts[c].add(chunk[c].value_counts(dropna=True), fill_value=0)
+        if self.sample_size:
+            self._add_to_sample(chunk, self._rng.random(len(chunk)))
+        return self
+
+    def _add_to_sample(self, rows, keys):
+        # Priority reservoir: the rows with the smallest uniform keys are a uniform sample
+        if self.sample is not None:
+            keys = np.concatenate([self._sample_keys, keys])
+            rows = pd.concat([self.sample, rows], ignore_index=True)
+        if len(rows) > self.sample_size:
+            keep = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            rows, keys = rows.iloc[keep], keys[keep]
+        self.sample, self._sample_keys = rows.reset_index(drop=True), keys
+
+    def merge(self, other):
+        """Fold another EDAStats over the same columns into this one."""
+        self.rows += other.rows
+        self._merge_moments(other.n, other.mean, other.m2, other.comoment)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        for mine, theirs in zip(self.digests, other.digests):
+            mine.merge_centroids(theirs.means, theirs.weights)
+        self.missing_counts = self.missing_counts.add(other.missing_counts, fill_value=0)
+        for c in self.cat_cols:
+            self.value_counts[c] = self.value_counts[c].add(other.value_counts[c], fill_value=0)
+        if self.sample_size and other.sample is not None:
+            self._add_to_sample(other.sample, other._sample_keys)
+        return self
+
+    def summary(self):
+        """count / mean / std / min / quartiles / max per numeric column, like describe().T."""
+        n = np.diag(self.n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(np.where(n > 1, np.diag(self.m2) / (n - 1), np.nan))
+        out = pd.DataFrame({'count': n, 'mean': np.where(n > 0, np.diag(self.mean), np.nan), 'std': std,
+                            'min': np.where(n > 0, self.min, np.nan)}, index=self.num_cols)
+        for q in QUANTILES:
+            out[f'{q:.0%}'] = np.nan
+        for i, digest in enumerate(self.digests):
+            if n[i]:
+                out.iloc[i, 4:4 + len(QUANTILES)] = digest.quantile(QUANTILES, self.min[i], self.max[i])
+        out['max'] = np.where(n > 0, self.max, np.nan)
+        return out
+
+    def missing(self):
+        """Percent missing per column, like df.isna().mean() * 100."""
+        return (self.missing_counts / max(self.rows, 1) * 100).astype(float)
+
+    def correlation(self):
+        """Pairwise-complete Pearson correlation of the numeric columns."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = self.comoment / np.sqrt(self.m2 * self.m2.T)
+        corr[self.n < 2] = np.nan
+        return pd.DataFrame(corr, index=self.num_cols, columns=self.num_cols)
+
+    def top_categories(self, k=10):
+        return {c: counts.sort_values(ascending=False).head(k).astype(np.int64) for c, counts in self.value_counts.items()}
+
+@timed('eda_profile')
+def profile_chunks(chunks, sample_size=0, random_state=0):
+    """One pass over an iterable of DataFrame chunks; returns their EDAStats.
+
+    Without any chunk the stats are empty (no columns, zero rows).
+    """
+    stats = None
+    for chunk in chunks:
+        if stats is None:
+            num_cols, cat_cols = split_feature_columns(chunk, exclude=set(ID_COLS))
+            stats = EDAStats(num_cols, cat_cols, chunk.columns, sample_size, random_state)
+        stats.update(chunk)
+    return stats if stats is not None else EDAStats([], [], [], sample_size, random_state)
+
+def frame_chunks(df, chunksize=100_000):
+    # An empty frame is still one chunk, so its columns are profiled
+    for start in range(0, max(len(df), 1), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+def cached_profile(fingerprint, build, cache_dir=EDA_CACHE_DIR, **params):
+    """Return the EDAStats cached for (fingerprint, params), or build() and cache it.
+
+    `params` (e.g. sample_size) are part of the key. cache_dir=None disables
+    the cache.
+    """
+    if not cache_dir:
+        return build()
+    key = hashlib.blake2b(repr((EDA_FORMAT_VERSION, fingerprint, sorted(params.items()))).encode(),
+                          digest_size=16).hexdigest()
+    path = os.path.join(cache_dir, f'{key}.joblib')
+    if os.path.exists(path):
+        return joblib.load(path)
+    stats = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    joblib.dump(stats, f'{path}.{os.getpid()}.tmp')
+    os.replace(f'{path}.{os.getpid()}.tmp', path)
+    return stats
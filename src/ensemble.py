@@ -0,0 +1,203 @@
+# src/ensemble.py
+"""Top-k model ensembles with P10/P90 revenue bands.
+
+build_ensemble() keeps the k best models from train_and_evaluate (by test
+RMSE), weights them by inverse MSE and optionally fits one multi-quantile
+XGBoost model for the P10/P90 band. The band is widened where needed to
+reach the ensemble's point estimate, so it always brackets the prediction it
+is shown with. The resulting EnsembleModel is stored as
+bundle['model'], so every existing caller keeps working through predict().
+
+    ensemble = build_ensemble(results, X_train, y_train, top_k=3, member_budget_ms=50)
+    ensemble.predict(X)              # weighted point estimate
+    ensemble.predict_intervals(X)    # {'prediction', 'p10', 'p90', 'members'}
+
+The best member runs in the calling thread while the others run on a thread
+pool over the same transformed matrix; XGBoost and scikit-learn's tree
+predictors release the GIL. Every member except the best one has a latency
+budget: a member that has not finished when its budget runs out is left out
+of that call (the point estimate is re-weighted over the members that
+answered, and a late quantile model gives NaN bands). Its job is cancelled
+if it has not started; one already running finishes in the background, and
+until it does that member is skipped rather than queued again, so late work
+never piles up in front of later calls.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import numpy as np
+
+from src.instrumentation import incr, observe
+
+DEFAULT_QUANTILES = (0.1, 0.9)
+QUANTILE_MEMBER = 'quantiles'
+
+def _sorted_quantiles(quantiles):
+    # Bands are sorted per row before they are labelled, so the labels must be sorted too
+    quantiles = tuple(sorted(float(q) for q in quantiles))
+    if len(set(quantiles)) < len(quantiles):
+        raise ValueError(f'Duplicate quantiles: {quantiles}')
+    return quantiles
+
+class EnsembleModel:
+    """Weighted average of fitted regressors plus an optional multi-quantile model.
+
+    `members` is a list of (name, model, weight) with the most trusted member
+    first; it runs in the calling thread and is always waited for.
+    `member_budget_ms` is a default budget in milliseconds for the other
+    members (None: no limit) or a {name: ms} dict.
+    """
+
+    def __init__(self, members, quantile_model=None, quantiles=DEFAULT_QUANTILES, member_budget_ms=None,
+                 max_workers=None):
+        if not members:
+            raise ValueError('An ensemble needs at least one member')
+        self.members = [(name, model, float(weight)) for name, model, weight in members]
+        self.quantile_model = quantile_model
+        self.quantiles = _sorted_quantiles(quantiles)
+        self.member_budget_ms = member_budget_ms
+        self.max_workers = max_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._late = {}                 # name -> future of a timed-out job still running
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['_pool_lock'] = None
+        state['_late'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pool_lock = threading.Lock()
+        self._late = {}
+
+    @property
+    def member_names(self):
+        return [name for name, _, _ in self.members]
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # The best member runs in the caller's thread
+                    workers = self.max_workers or max(1, len(self.members) - 1 + (self.quantile_model is not None))
+                    self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cmm-ensemble')
+        return self._pool
+
+    def _budget(self, name):
+        budget = self.member_budget_ms
+        if isinstance(budget, dict):
+            budget = budget.get(name)
+        return None if budget is None else budget / 1000.0
+
+    @staticmethod
+    def _timed_predict(name, model, X):
+        start = time.perf_counter()
+        out = np.asarray(model.predict(X), dtype=float)
+        observe('ensemble_member_predict', time.perf_counter() - start, member=name)
+        return out
+
+    def _submit(self, others, X):
+        pool = self._executor()
+        jobs = []
+        with self._pool_lock:
+            for name, model in others:
+                late = self._late.get(name)
+                if late is not None and not late.done():
+                    incr('ensemble_member_skips', member=name)
+                    continue
+                self._late.pop(name, None)
+                jobs.append((name, pool.submit(self._timed_predict, name, model, X)))
+        return jobs
+
+    def _run(self, X, with_quantiles):
+        """{name: predictions} of the members that answered within their budgets."""
+        start = time.perf_counter()
+        others = [(name, model) for name, model, _ in self.members[1:]]
+        if with_quantiles and self.quantile_model is not None:
+            others.append((QUANTILE_MEMBER, self.quantile_model))
+        jobs = self._submit(others, X) if others else []
+        best_name, best_model, _ = self.members[0]
+        outputs = {best_name: self._timed_predict(best_name, best_model, X)}
+        for name, future in jobs:
+            budget = self._budget(name)
+            timeout = None if budget is None else max(0.0, start + budget - time.perf_counter())
+            try:
+                outputs[name] = future.result(timeout=timeout)
+            except TimeoutError:
+                incr('ensemble_member_timeouts', member=name)
+                if not future.cancel():
+                    with self._pool_lock:
+                        self._late[name] = future
+        return outputs
+
+    def _combine(self, outputs):
+        used = [(name, weight) for name, _, weight in self.members if name in outputs]
+        total = sum(weight for _, weight in used)
+        return sum(outputs[name] * (weight / total) for name, weight in used), [name for name, _ in used]
+
+    def predict(self, X):
+        return self._combine(self._run(X, with_quantiles=False))[0]
+
+    def predict_intervals(self, X):
+        """Point estimate, the quantile band and the members used, from one batched call.
+
+        The band keys are named after the quantiles ('p10', 'p90'); they are
+        NaN when there is no quantile model or it missed its budget. The
+        quantile model is fitted separately from the members, so where its band
+        misses the point estimate the nearer edge is moved out to it.
+        """
+        outputs = self._run(X, with_quantiles=True)
+        point, used = self._combine(outputs)
+        result = {'prediction': point, 'members': used}
+        bands = outputs.get(QUANTILE_MEMBER)
+        if bands is not None:
+            # Independently fitted quantiles can cross; sorting restores their order
+            bands = np.sort(bands.reshape(len(point), -1), axis=1)
+            bands[:, 0] = np.minimum(bands[:, 0], point)
+            bands[:, -1] = np.maximum(bands[:, -1], point)
+        for j, q in enumerate(self.quantiles):
+            result[quantile_key(q)] = bands[:, j] if bands is not None else np.full(len(point), np.nan)
+        return result
+
+def quantile_key(q):
+    return f'p{round(q * 100):g}'
+
+def interval_keys(model):
+    """The band keys predict_intervals() returns for `model` ([] for non-ensembles)."""
+    return [quantile_key(q) for q in getattr(model, 'quantiles', ())] if hasattr(model, 'predict_intervals') else []
+
+def fit_quantile_model(X_train, y_train, quantiles=DEFAULT_QUANTILES, random_state=42, n_jobs=None):
+    """One XGBoost model predicting every quantile in `quantiles`, ascending (pinball loss, early-stopped)."""
+    from sklearn.model_selection import train_test_split
+    from xgboost import XGBRegressor
+    from src.modeling import XGB_EARLY_STOPPING_ROUNDS
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=0.1, random_state=random_state)
+    model = XGBRegressor(objective='reg:quantileerror', quantile_alpha=np.asarray(_sorted_quantiles(quantiles)), n_estimators=1000,
+                         early_stopping_rounds=XGB_EARLY_STOPPING_ROUNDS, random_state=random_state, verbosity=0,
+                         n_jobs=n_jobs)
+    return model.fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False)
+
+def build_ensemble(results, X_train=None, y_train=None, top_k=3, quantiles=DEFAULT_QUANTILES, member_budget_ms=None,
+                   random_state=42, n_jobs=None):
+    """EnsembleModel from train_and_evaluate's results: the top_k models by RMSE, inverse-MSE weighted.
+
+    With `quantiles` (and the training rows) a multi-quantile XGBoost model
+    is fitted for the band; pass quantiles=None to skip it.
+    """
+    ranked = sorted(results.items(), key=lambda kv: kv[1]['metrics']['rmse'])[:max(1, top_k)]
+    members = [(name, res['model'], 1.0 / max(res['metrics']['rmse'], 1e-12) ** 2) for name, res in ranked]
+    quantiles = _sorted_quantiles(quantiles or ())
+    quantile_model = None
+    if quantiles and X_train is not None:
+        quantile_model = fit_quantile_model(X_train, y_train, quantiles, random_state, n_jobs)
+    return EnsembleModel(members, quantile_model, quantiles, member_budget_ms)
+
+def interval_coverage(result, y, quantiles=DEFAULT_QUANTILES):
+    """Share of `y` inside the outermost quantile band of a predict_intervals result."""
+    lo, hi = result[quantile_key(min(quantiles))], result[quantile_key(max(quantiles))]
+    y = np.asarray(y, dtype=float)
+    return float(np.mean((y >= lo) & (y <= hi)))
@@ -0,0 +1,170 @@
+# src/explain.py
+"""Per-prediction SHAP explanations for a model bundle.
+
+    explainer = Explainer(bundle, cache=PredictionCache(50_000), n_jobs=4)
+    contributions = explainer.explain(X)          # one column per model feature + base_value
+    by_input = group_by_input(contributions, bundle['artifacts'])   # one-hot columns summed per input
+
+The rows of explain() add up to the model's prediction. How they are computed
+depends on the model:
+
+- XGBoost: the booster's own TreeSHAP (pred_contribs), multi-threaded and
+  without the GIL; these are the values shap.TreeExplainer returns;
+- RandomForest and other scikit-learn tree ensembles: shap.TreeExplainer
+  (path-dependent, so no background data is needed);
+- Ridge/Lasso/LinearRegression/SGD: coef * (x - background mean), the values
+  of shap.LinearExplainer with an independent masker, computed directly;
+- an EnsembleModel: the weighted sum of its members' values (SHAP values are
+  additive over a weighted average of models).
+
+The background is a k-means summary of the training matrix computed once by
+summarize_background() and stored in artifacts['shap_background'].
+
+Rows are explained in chunks across `n_jobs` threads. With a PredictionCache,
+values are memoized per transformed feature vector (keyed like predictions,
+with the bundle fingerprint), so repeated rows are explained once.
+"""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.ensemble import EnsembleModel
+from src.instrumentation import incr, timed
+from src.prediction_cache import row_keys
+
+BACKGROUND_KEY = 'shap_background'
+BASE_VALUE_COL = 'base_value'
+SHAP_PREFIX = 'shap_'
+
+def summarize_background(X, k=50, sample_size=10_000, random_state=0):
+    """k-means summary of a model matrix: {'data': centroids, 'weights': share of rows per centroid}."""
+    from sklearn.cluster import KMeans
+    from scipy import sparse as sp
+    n = X.shape[0]
+    if n > sample_size:
+        rows = np.random.default_rng(random_state).choice(n, sample_size, replace=False)
+        X = X[rows] if sp.issparse(X) else np.asarray(X)[rows]
+    X = X.tocsr() if sp.issparse(X) else np.asarray(X, dtype=np.float64)
+    km = KMeans(n_clusters=min(k, X.shape[0]), n_init=3, random_state=random_state).fit(X)
+    weights = np.bincount(km.labels_, minlength=km.n_clusters) / X.shape[0]
+    return {'data': km.cluster_centers_, 'weights': weights}
+
+def _dense(X):
+    from scipy import sparse as sp
+    return X.toarray() if sp.issparse(X) else np.asarray(X, dtype=np.float64)
+
+def _xgboost_contributions(model):
+    import xgboost
+    booster = model.get_booster()
+    best = getattr(model, 'best_iteration', None)
+    # Same trees as model.predict, which stops at the early-stopping round
+    iteration_range = (0, best + 1) if best is not None else (0, 0)
+
+    def contributions(X):
+        data = xgboost.DMatrix(X, feature_names=booster.feature_names)
+        return booster.predict(data, pred_contribs=True, iteration_range=iteration_range)
+    return contributions
+
+def _tree_contributions(model):
+    import shap
+    explainer = shap.TreeExplainer(model)
+    base = float(np.ravel(explainer.expected_value)[0])
+
+    def contributions(X):
+        values = explainer.shap_values(_dense(X), check_additivity=False)
+        return np.column_stack([values, np.full(len(values), base)])
+    return contributions
+
+def _linear_contributions(model, background):
+    if background is None:
+        raise ValueError('Linear models need artifacts["shap_background"]; retrain or add it with summarize_background()')
+    coef = np.ravel(model.coef_).astype(np.float64)
+    mean = np.average(background['data'], axis=0, weights=background['weights'])
+    base = float(np.ravel(model.intercept_)[0]) + float(mean @ coef)
+
+    def contributions(X):
+        values = (_dense(X) - mean) * coef
+        return np.column_stack([values, np.full(len(values), base)])
+    return contributions
+
+def _ensemble_contributions(model, background):
+    total = sum(weight for _, _, weight in model.members)
+    parts = [(weight / total, contributions_for(member, background)) for _, member, weight in model.members]
+
+    def contributions(X):
+        return sum(w * fn(X) for w, fn in parts)
+    return contributions
+
+def contributions_for(model, background=None):
+    """A function X -> (n_rows, n_features + 1) array of SHAP values, the base value last."""
+    from src.modeling import _is_xgboost
+    if isinstance(model, EnsembleModel):
+        return _ensemble_contributions(model, background)
+    if _is_xgboost(model):
+        return _xgboost_contributions(model)
+    if hasattr(model, 'estimators_') or hasattr(model, 'tree_'):
+        return _tree_contributions(model)
+    if hasattr(model, 'coef_'):
+        return _linear_contributions(model, background)
+    raise TypeError(f'No SHAP explainer for {type(model).__name__}')
+
+class Explainer:
+    """SHAP values for a model bundle, explained in chunks and memoized per feature vector.
+
+    Always explains the native bundle['model'] (never the compiled engine).
+    `fingerprint` identifies the bundle in cache keys; pass the one the
+    predictions use when sharing a cache across reloads.
+    """
+
+    def __init__(self, bundle, cache=None, chunksize=1000, n_jobs=1, fingerprint=None):
+        self.artifacts = bundle['artifacts']
+        self.feature_columns = list(self.artifacts['feature_columns'])
+        self.cache = cache
+        self.chunksize = chunksize
+        self.n_jobs = n_jobs
+        self._salt = f'shap-{fingerprint or uuid.uuid4().hex}'
+        self._contributions = contributions_for(bundle['model'], self.artifacts.get(BACKGROUND_KEY))
+
+    def _compute(self, X):
+        chunks = [X[start:start + self.chunksize] for start in range(0, X.shape[0], self.chunksize)]
+        if self.n_jobs == 1 or len(chunks) == 1:
+            parts = [self._contributions(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+                parts = list(pool.map(self._contributions, chunks))
+        return np.vstack(parts) if parts else np.empty((0, len(self.feature_columns) + 1))
+
+    @timed('shap_explain')
+    def explain(self, X):
+        """Per-row contributions of each model feature plus the base value, as a DataFrame."""
+        index = X.index if isinstance(X, pd.DataFrame) else None
+        matrix = X.to_numpy(dtype=np.float64) if isinstance(X, pd.DataFrame) else X
+        if self.cache is None:
+            values = self._compute(matrix)
+        else:
+            keys = row_keys(matrix, self._salt)
+            found = self.cache.get_many(keys)
+            incr('shap_cache_hits', len(found))
+            incr('shap_cache_misses', len(keys) - len(found))
+            values = np.empty((len(keys), len(self.feature_columns) + 1))
+            for i, row in found.items():
+                values[i] = row
+            if len(found) < len(keys):
+                missing = np.array([i for i in range(len(keys)) if i not in found])
+                fresh = self._compute(matrix[missing])
+                values[missing] = fresh
+                self.cache.set_many([keys[i] for i in missing], list(fresh))
+        incr('rows_explained', len(values))
+        return pd.DataFrame(values, columns=self.feature_columns + [BASE_VALUE_COL], index=index)
+
+def group_by_input(contributions, artifacts):
+    """Sum the contributions of each categorical's one-hot columns into one column per input feature."""
+    cat_cols = sorted(artifacts.get('cat_cols', []), key=len, reverse=True)
+    groups = {}
+    for col in contributions.columns:
+        owner = next((c for c in cat_cols if col.startswith(f'{c}_')), col)
+        groups.setdefault(owner, []).append(col)
+    return pd.DataFrame({owner: contributions[cols].sum(axis=1) for owner, cols in groups.items()},
+                        index=contributions.index)
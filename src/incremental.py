@@ -0,0 +1,207 @@
+# src/incremental.py
+"""Out-of-core training for datasets larger than RAM.
+
+The CSV is streamed in chunks several times and never loaded whole:
+
+1. statistics pass: a fixed-size reservoir sample of rows (for the numeric
+   medians) plus exact per-column category counts (for the most-frequent
+   values and the one-hot category lists);
+2. scaling pass: StandardScaler.partial_fit over the imputed numerics;
+3. learning passes: SGDRegressor.partial_fit for `epochs` passes, or an
+   XGBoost booster trained from an external-memory DMatrix.
+
+Rows are split into train/holdout with a per-chunk seeded mask, so every pass
+sees the same split. The result is the usual {'model', 'artifacts'} bundle.
+Duplicate rows are only removed within a chunk.
+"""
+import os
+import tempfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from src.data_processing import (
+    TARGET, ID_COLS, basic_cleaning, feature_engineering, build_preprocessor,
+    split_feature_columns, transform_features, read_csv_chunks,
+)
+
+class ScaledTargetRegressor:
+    """Wraps a regressor trained on a standardized target; predicts in original units."""
+
+    def __init__(self, model, y_mean, y_std):
+        self.model = model
+        self.y_mean = y_mean
+        self.y_std = y_std
+
+    def predict(self, X):
+        return self.model.predict(X) * self.y_std + self.y_mean
+
+def _reference_date(path):
+    ref = None
+    for chunk in pd.read_csv(path, usecols=['date'], parse_dates=['date'], chunksize=1_000_000):
+        m = chunk['date'].max()
+        if pd.notna(m) and (ref is None or m > ref):
+            ref = m
+    return ref
+
+def _chunks(path, chunksize, reference_date, target, holdout, random_state):
+    """Yield (chunk_index, train_rows, holdout_rows) with a split that is stable across passes."""
+    for i, chunk in enumerate(read_csv_chunks(path, chunksize)):
+        chunk = basic_cleaning(chunk, copy=False)
+        chunk = feature_engineering(chunk, reference_date=reference_date, copy=False)
+        chunk = chunk[chunk[target].notna()]
+        mask = np.random.default_rng(random_state + i).random(len(chunk)) < holdout
+        yield i, chunk[~mask], chunk[mask]
+
+def _statistics_pass(chunks, num_cols, cat_cols, sample_size, random_state):
+    rng = np.random.default_rng(random_state)
+    counts = {c: Counter() for c in cat_cols}
+    sample, sample_keys = None, None
+    for _, train, _ in chunks:
+        for c in cat_cols:
+            if c in train.columns:
+                counts[c].update(train[c].dropna().astype(str).value_counts().to_dict())
+        # Priority reservoir: keep the rows with the smallest random keys seen so far
+        rows = train.reindex(columns=num_cols + cat_cols)
+        keys = rng.random(len(rows))
+        if sample is None:
+            sample, sample_keys = rows, keys
+        else:
+            sample = pd.concat([sample, rows], ignore_index=True)
+            sample_keys = np.concatenate([sample_keys, keys])
+        if len(sample) > sample_size:
+            keep = np.argpartition(sample_keys, sample_size)[:sample_size]
+            sample, sample_keys = sample.iloc[keep].reset_index(drop=True), sample_keys[keep]
+    return sample, counts
+
+def _fit_preprocessor(sample, counts, num_cols, cat_cols, sparse):
+    preprocessor = build_preprocessor(num_cols, cat_cols, sparse=sparse)
+    cat_pipe = preprocessor.transformers[1][1]
+    categories = [sorted(counts[c]) for c in cat_cols]
+    cat_pipe.named_steps['encoder'].set_params(categories=categories)
+    sample = sample.copy()
+    for c in cat_cols:
+        sample[c] = sample[c].astype(object)
+    preprocessor.fit(sample)
+    # Most-frequent values come from the exact counts, not the sample
+    if cat_cols:
+        modes = [counts[c].most_common(1)[0][0] if counts[c] else 'missing' for c in cat_cols]
+        preprocessor.named_transformers_['cat'].named_steps['imputer'].statistics_ = np.array(modes, dtype=object)
+    return preprocessor
+
+def _scaling_pass(chunks, preprocessor, num_cols, target):
+    from sklearn.preprocessing import StandardScaler
+    num_pipe = preprocessor.named_transformers_['num']
+    imputer = num_pipe.named_steps['imputer']
+    scaler = StandardScaler()
+    y_stats = StandardScaler()
+    for _, train, _ in chunks:
+        if len(train):
+            scaler.partial_fit(imputer.transform(train.reindex(columns=num_cols)))
+            y_stats.partial_fit(train[[target]].to_numpy())
+    num_pipe.steps[-1] = ('scaler', scaler)
+    return float(y_stats.mean_[0]), float(y_stats.scale_[0])
+
+def _holdout_metrics(sums):
+    n = sums['n']
+    if not n:
+        return {}
+    sst = sums['yy'] - sums['y'] ** 2 / n
+    return {
+        'r2': 1 - sums['sse'] / sst if sst else float('nan'),
+        'rmse': float(np.sqrt(sums['sse'] / n)),
+        'mae': sums['sae'] / n,
+        'n_holdout': n,
+    }
+
+def _evaluate(model, chunks, artifacts, target):
+    sums = {'n': 0, 'sse': 0.0, 'sae': 0.0, 'y': 0.0, 'yy': 0.0}
+    for _, _, hold in chunks:
+        if not len(hold):
+            continue
+        y = hold[target].to_numpy(dtype=float)
+        err = model.predict(transform_features(hold, artifacts)) - y
+        sums['n'] += len(y)
+        sums['sse'] += float(err @ err)
+        sums['sae'] += float(np.abs(err).sum())
+        sums['y'] += float(y.sum())
+        sums['yy'] += float(y @ y)
+    return _holdout_metrics(sums)
+
+def _train_sgd(make_chunks, artifacts, target, epochs, y_mean, y_std, random_state):
+    # A small initial step keeps heavy-tailed ratio features from blowing up early updates
+    from sklearn.linear_model import SGDRegressor
+    sgd = SGDRegressor(random_state=random_state, learning_rate='invscaling', eta0=0.001)
+    for _ in range(epochs):
+        for _, train, _ in make_chunks():
+            if len(train):
+                y = (train[target].to_numpy(dtype=float) - y_mean) / y_std
+                sgd.partial_fit(transform_features(train, artifacts), y)
+    return ScaledTargetRegressor(sgd, y_mean, y_std)
+
+def _train_xgboost(make_chunks, artifacts, target, num_boost_round, random_state, cache_dir):
+    import xgboost as xgb
+
+    class ChunkIter(xgb.DataIter):
+        def __init__(self, part, prefix):
+            self._part = part
+            self._it = make_chunks()
+            super().__init__(cache_prefix=prefix)
+
+        def next(self, input_data):
+            for _, train, hold in self._it:
+                rows = train if self._part == 'train' else hold
+                if len(rows):
+                    input_data(data=transform_features(rows, artifacts), label=rows[target].to_numpy(dtype=float))
+                    return 1
+            return 0
+
+        def reset(self):
+            self._it = make_chunks()
+
+    with tempfile.TemporaryDirectory(dir=cache_dir) as tmp:
+        train_iter = ChunkIter('train', os.path.join(tmp, 'train'))
+        holdout_iter = ChunkIter('holdout', os.path.join(tmp, 'holdout'))
+        dtrain, dval = xgb.DMatrix(train_iter), xgb.DMatrix(holdout_iter)
+        params = {'objective': 'reg:squarederror', 'tree_method': 'hist', 'seed': random_state}
+        booster = xgb.train(params, dtrain, num_boost_round=num_boost_round, evals=[(dval, 'holdout')],
+                            early_stopping_rounds=20, verbose_eval=False)
+        # Free the external-memory pages before their cache directory is removed
+        del dtrain, dval, train_iter, holdout_iter
+    model = xgb.XGBRegressor()
+    model.load_model(bytearray(booster.save_raw(raw_format='json')))
+    return model
+
+def train_incremental(path, target=TARGET, learner='sgd', chunksize=100_000, epochs=5, sample_size=100_000,
+                      holdout=0.2, sparse=False, num_boost_round=500, random_state=42, cache_dir=None):
+    """Train on a CSV without loading it into memory; returns (bundle, holdout_metrics).
+
+    learner is 'sgd' (SGDRegressor via partial_fit) or 'xgboost' (external-memory
+    DMatrix). `cache_dir` holds XGBoost's on-disk page cache (default: system temp).
+    """
+    reference_date = _reference_date(path)
+
+    def make_chunks():
+        return _chunks(path, chunksize, reference_date, target, holdout, random_state)
+
+    _, first, _ = next(make_chunks())
+    num_cols, cat_cols = split_feature_columns(first, exclude=set(ID_COLS) | {target})
+
+    sample, counts = _statistics_pass(make_chunks(), num_cols, cat_cols, sample_size, random_state)
+    preprocessor = _fit_preprocessor(sample, counts, num_cols, cat_cols, sparse)
+    y_mean, y_std = _scaling_pass(make_chunks(), preprocessor, num_cols, target)
+    artifacts = {
+        'preprocessor': preprocessor, 'num_cols': num_cols, 'cat_cols': cat_cols,
+        'feature_columns': list(preprocessor.get_feature_names_out()), 'reference_date': reference_date,
+    }
+
+    if learner == 'sgd':
+        model = _train_sgd(make_chunks, artifacts, target, epochs, y_mean, y_std, random_state)
+    elif learner == 'xgboost':
+        model = _train_xgboost(make_chunks, artifacts, target, num_boost_round, random_state, cache_dir)
+    else:
+        raise ValueError(f"Unknown incremental learner {learner!r}; expected 'sgd' or 'xgboost'")
+
+    metrics = _evaluate(model, make_chunks(), artifacts, target)
+    return {'model': model, 'artifacts': artifacts}, metrics
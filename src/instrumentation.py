@@ -0,0 +1,263 @@
+# src/instrumentation.py
+"""Low-overhead timers and counters for the fetch -> features -> predict path.
+
+Recording is off unless CMM_METRICS=1 is set or enable() is called. While off,
+timer() hands back one shared no-op context manager and @timed calls the
+wrapped function directly, so instrumented code pays a global lookup.
+
+    from src.instrumentation import timer, timed, incr
+
+    with timer('yt_api_request', endpoint='videos'):
+        ...
+    incr('yt_cache_hits', len(hits), kind='video')
+
+    @timed('feature_engineering')
+    def feature_engineering(df): ...
+
+prometheus_text() renders every series in the Prometheus exposition format
+(timers as histograms); snapshot() / write_jsonl(path) give one JSON record
+per series. With CMM_METRICS_JSONL=<path> a snapshot is appended at exit.
+
+For call-level detail, profile_block(name) dumps cProfile stats to
+CMM_PROFILE_DIR when that is set, and StackSampler collects collapsed stacks
+(the flamegraph / speedscope input py-spy also produces) from inside the
+process, e.g. on a dyno where py-spy cannot attach.
+"""
+import atexit
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = 'cmm_'
+
+_enabled = os.environ.get('CMM_METRICS', '').lower() in ('1', 'true', 'yes')
+_NULL = nullcontext()
+_lock = threading.Lock()
+_timers = {}    # (name, labels) -> [count, sum, max, bucket counts]
+_counters = {}  # (name, labels) -> value
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+def observe(name, seconds, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        series = _timers.get(key)
+        if series is None:
+            series = _timers[key] = [0, 0.0, 0.0, [0] * len(BUCKETS)]
+        series[0] += 1
+        series[1] += seconds
+        series[2] = max(series[2], seconds)
+        buckets = series[3]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+                break
+
+def incr(name, value=1, **labels):
+    if not _enabled or not value:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+class _Timer:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+def timer(name, **labels):
+    """Time a block; a shared no-op when instrumentation is disabled."""
+    if not _enabled:
+        return _NULL
+    return _Timer(name, labels)
+
+def timed(name=None, **labels):
+    """Decorator form of timer(); defaults to the function's qualified name."""
+    def decorator(fn):
+        metric = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Timer(metric, labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def snapshot():
+    """One dict per series: timers with count/sum/mean/max, counters with value."""
+    now = time.time()
+    with _lock:
+        timers = [(k, v[0], v[1], v[2]) for k, v in _timers.items()]
+        counters = list(_counters.items())
+    out = []
+    for (name, labels), count, total, peak in sorted(timers):
+        out.append({'ts': now, 'type': 'timer', 'name': name, 'labels': dict(labels), 'count': count,
+                    'sum_s': round(total, 6), 'mean_ms': round(total / count * 1000, 3), 'max_ms': round(peak * 1000, 3)})
+    for (name, labels), value in sorted(counters):
+        out.append({'ts': now, 'type': 'counter', 'name': name, 'labels': dict(labels), 'value': value})
+    return out
+
+def write_jsonl(path):
+    records = snapshot()
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for r in records:
+            f.write(json.dumps(r) + '\n')
+    return len(records)
+
+def _labels_text(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+def prometheus_text():
+    with _lock:
+        timers = {k: (v[0], v[1], list(v[3])) for k, v in _timers.items()}
+        counters = dict(_counters)
+    lines = []
+    for metric in sorted({name for name, _ in timers}):
+        full = f'{PREFIX}{metric}_seconds'
+        lines.append(f'# TYPE {full} histogram')
+        for (name, labels), (count, total, buckets) in sorted(timers.items()):
+            if name != metric:
+                continue
+            cumulative = 0
+            for bound, n in zip(BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'{full}_bucket{_labels_text(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{full}_bucket{_labels_text(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{full}_sum{_labels_text(labels)} {total}')
+            lines.append(f'{full}_count{_labels_text(labels)} {count}')
+    for metric in sorted({name for name, _ in counters}):
+        full = f'{PREFIX}{metric}_total'
+        lines.append(f'# TYPE {full} counter')
+        for (name, labels), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f'{full}{_labels_text(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+_profile_seq = Counter()
+
+@contextmanager
+def profile_block(name, directory=None):
+    """cProfile a block into <directory>/<name>-<pid>-<n>.prof (default: CMM_PROFILE_DIR).
+
+    A no-op when no directory is configured. Inspect with `python -m pstats`
+    or snakeviz.
+    """
+    directory = directory or os.environ.get('CMM_PROFILE_DIR')
+    if not directory:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is already active in this thread
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        with _lock:
+            _profile_seq[name] += 1
+            seq = _profile_seq[name]
+        profiler.dump_stats(os.path.join(directory, f'{name}-{os.getpid()}-{seq}.prof'))
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds from a daemon thread.
+
+        with StackSampler() as sampler:
+            predictor.predict_rows(rows)
+        sampler.write('predict.collapsed')   # flamegraph.pl / speedscope input
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='cmm-stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {n}' for stack, n in self.stacks.most_common())
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed() + '\n')
+
+if os.environ.get('CMM_METRICS_JSONL'):
+    atexit.register(lambda: write_jsonl(os.environ['CMM_METRICS_JSONL']) if _enabled else None)
@@ -1,40 +1,428 @@
+import hashlib
+import os
+import re
+import time
+import uuid
+import warnings
 import numpy as np
+import pandas as pd
 import joblib
-from sklearn.linear_model import LinearRegression, Ridge, Lasso
-from sklearn.ensemble import RandomForestRegressor
-from xgboost import XGBRegressor
-from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
+from joblib import Parallel, delayed, parallel_backend
+from concurrent.futures import ProcessPoolExecutor
+from src.data_processing import raw_to_model_matrix, read_csv_chunks
+from src.instrumentation import incr, timed, timer
+from src.tree_engine import resolve_model
+from src.ensemble import interval_keys
+from src.explain import SHAP_PREFIX, Explainer, group_by_input
 
-def get_models(random_state=42):
+# scikit-learn, SciPy and XGBoost are imported where they are used, so scoring
+# processes only load what the unpickled bundle itself needs.
+
+PREDICTION_COL = 'predicted_ad_revenue_usd'
+EXPLAIN_CACHE_SIZE = 100_000
+ARTIFACT_FORMAT_VERSION = 2
+
+def default_param_spaces():
+    """Randomized / successive-halving search spaces per model."""
+    from scipy.stats import loguniform, randint, uniform
+    return {
+        'LinearRegression': {},
+        'Ridge': {'alpha': loguniform(1e-3, 1e3)},
+        'Lasso': {'alpha': loguniform(1e-3, 1e2)},
+        'RandomForest': {
+            'n_estimators': randint(100, 500),
+            'max_depth': [None, 8, 16, 32],
+            'min_samples_leaf': randint(1, 10),
+            'max_features': [1.0, 'sqrt', 0.5],
+        },
+        'XGBoost': {
+            'max_depth': randint(3, 10),
+            'learning_rate': loguniform(0.01, 0.3),
+            'subsample': uniform(0.6, 0.4),
+            'colsample_bytree': uniform(0.6, 0.4),
+            'min_child_weight': randint(1, 10),
+        },
+    }
+XGB_EARLY_STOPPING_ROUNDS = 20
+
+def get_models(random_state=42, n_jobs=None):
+    from sklearn.linear_model import LinearRegression, Ridge, Lasso
+    from sklearn.ensemble import RandomForestRegressor
+    from xgboost import XGBRegressor
     models = {
         'LinearRegression': LinearRegression(),
         'Ridge': Ridge(random_state=random_state),
         'Lasso': Lasso(random_state=random_state),
-        'RandomForest': RandomForestRegressor(n_estimators=100, random_state=random_state),
-        'XGBoost': XGBRegressor(n_estimators=100, random_state=random_state, verbosity=0)
+        'RandomForest': RandomForestRegressor(n_estimators=100, random_state=random_state, n_jobs=n_jobs),
+        'XGBoost': XGBRegressor(n_estimators=100, random_state=random_state, verbosity=0, n_jobs=n_jobs)
     }
     return models
 
 def evaluate_model(model, X_test, y_test):
+    from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
     preds = model.predict(X_test)
     r2 = r2_score(y_test, preds)
     rmse = mean_squared_error(y_test, preds, squared=False)
     mae = mean_absolute_error(y_test, preds)
     return {'r2': r2, 'rmse': rmse, 'mae': mae}
 
-def train_and_evaluate(X_train, y_train, X_test, y_test):
-    models = get_models()
-    results = {}
-    for name, m in models.items():
-        m.fit(X_train, y_train)
-        results[name] = {'model': m, 'metrics': evaluate_model(m, X_test, y_test)}
+def _make_search(model, space, search, n_iter, n_jobs, random_state):
+    if search == 'halving':
+        from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+        from sklearn.model_selection import HalvingRandomSearchCV
+        # Start with 3x the candidates of a random search; each round keeps the best third
+        return HalvingRandomSearchCV(model, space, n_candidates=3 * n_iter, scoring='neg_root_mean_squared_error',
+                                     cv=3, n_jobs=n_jobs, random_state=random_state)
+    from sklearn.model_selection import RandomizedSearchCV
+    return RandomizedSearchCV(model, space, n_iter=n_iter, scoring='neg_root_mean_squared_error', cv=3,
+                              n_jobs=n_jobs, random_state=random_state)
+
+def _take(data, rows):
+    return data.iloc[rows] if isinstance(data, (pd.DataFrame, pd.Series)) else data[rows]
+
+def _score_candidates(model, candidates, X, y, fit_params, n_jobs, deadline):
+    """CV scores of `candidates`, `n_jobs` at a time; after the first batch none is started past `deadline`."""
+    from sklearn.model_selection import GridSearchCV
+    scores = []
+    batch = max(1, n_jobs)
+    for start in range(0, len(candidates), batch):
+        if scores and time.time() > deadline:
+            break
+        # One single-point grid per candidate, so the results keep the candidates' order
+        grid = [{k: [v] for k, v in params.items()} for params in candidates[start:start + batch]]
+        searcher = GridSearchCV(model, grid, scoring='neg_root_mean_squared_error', cv=3, n_jobs=n_jobs, refit=False)
+        scores.extend(searcher.fit(X, y, **fit_params).cv_results_['mean_test_score'])
+    return scores
+
+def _ranking(scores):
+    # A candidate whose fit failed scores NaN, which would otherwise sort first
+    scores = np.asarray(scores, dtype=float)
+    return np.where(np.isnan(scores), -np.inf, scores)
+
+def _bounded_search(model, space, search, n_iter, n_jobs, random_state, X, y, fit_params, deadline):
+    """Random or successive-halving search that starts no candidate batch after `deadline`.
+
+    At least one batch is always scored, so a started search returns a model.
+    Halving follows HalvingRandomSearchCV: 3 * n_iter candidates on a small
+    row sample, the best third kept each round on 3x the rows, the last round
+    on all rows. Returns (fitted best model, best params, {'evaluated',
+    'planned', 'cut_short'}), counting candidate evaluations over all rounds.
+    """
+    from sklearn.base import clone
+    from sklearn.model_selection import ParameterSampler
+    candidates = list(ParameterSampler(space, 3 * n_iter if search == 'halving' else n_iter, random_state=random_state))
+    planned, evaluated, best, cut_short = len(candidates), 0, None, False
+    if search == 'halving':
+        n_rounds = max(1, int(np.ceil(np.log(len(candidates)) / np.log(3))))
+        # Planned candidate evaluations over all rounds
+        planned = sum(max(1, len(candidates) // 3 ** i) for i in range(n_rounds))
+        rng = np.random.default_rng(random_state)
+        for i in range(n_rounds):
+            if i and time.time() > deadline:
+                cut_short = True
+                break
+            n_rows = max(min(X.shape[0], 60), X.shape[0] // 3 ** (n_rounds - 1 - i))
+            rows = np.sort(rng.choice(X.shape[0], n_rows, replace=False))
+            scores = _score_candidates(model, candidates, _take(X, rows), _take(y, rows), fit_params, n_jobs, deadline)
+            evaluated += len(scores)
+            # A partly scored round still ranks its candidates on the same rows; failed fits rank last
+            ranked = [candidates[j] for j in np.argsort(_ranking(scores))[::-1]]
+            best = ranked[0]
+            if len(scores) < len(candidates):
+                cut_short = True
+                break
+            candidates = ranked[:max(1, len(ranked) // 3)]
+    else:
+        scores = _score_candidates(model, candidates, X, y, fit_params, n_jobs, deadline)
+        evaluated = len(scores)
+        best = candidates[int(np.argmax(_ranking(scores)))]
+        cut_short = evaluated < planned
+    fitted = clone(model).set_params(**best).fit(X, y, **fit_params)
+    return fitted, best, {'evaluated': evaluated, 'planned': planned, 'cut_short': cut_short}
+
+def _fit_candidate(name, model, X_train, y_train, X_test, y_test, search, space, n_iter, inner_jobs, deadline, random_state):
+    if deadline is not None and time.time() > deadline:
+        return name, None
+    start = time.perf_counter()
+    fit_params = {}
+    if name == 'XGBoost':
+        from sklearn.model_selection import train_test_split
+        # Hold out part of the training split to stop boosting once validation RMSE stalls
+        X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=0.1, random_state=random_state)
+        model.set_params(n_estimators=1000, early_stopping_rounds=XGB_EARLY_STOPPING_ROUNDS)
+        fit_params = {'eval_set': [(X_val, y_val)], 'verbose': False}
+    else:
+        X_fit, y_fit = X_train, y_train
+    best_params = search_info = None
+    if search and space:
+        # Parallelism goes to the CV fits; each candidate fit stays single-threaded
+        if 'n_jobs' in model.get_params():
+            model.set_params(n_jobs=1)
+        if deadline is None:
+            searcher = _make_search(model, space, search, n_iter, inner_jobs, random_state)
+            searcher.fit(X_fit, y_fit, **fit_params)
+            model, best_params = searcher.best_estimator_, searcher.best_params_
+        else:
+            # Checks the budget between candidate batches instead of only before the search
+            model, best_params, search_info = _bounded_search(model, space, search, n_iter, inner_jobs, random_state,
+                                                              X_fit, y_fit, fit_params, deadline)
+    else:
+        if 'n_jobs' in model.get_params():
+            model.set_params(n_jobs=inner_jobs)
+        model.fit(X_fit, y_fit, **fit_params)
+    fit_time = time.perf_counter() - start
+    metrics = evaluate_model(model, X_test, y_test)
+    metrics['fit_time'] = fit_time
+    return name, {'model': model, 'metrics': metrics, 'best_params': best_params, 'search': search_info}
+
+def train_and_evaluate(X_train, y_train, X_test, y_test, n_jobs=1, search=None, n_iter=10,
+                       time_budget=None, param_spaces=None, random_state=42):
+    """Fit every candidate model, in parallel when n_jobs > 1, and pick the best by RMSE.
+
+    `n_jobs` is the total core budget (-1 = all cores): it is split between
+    concurrent model fits and each model's own threads so the two levels never
+    oversubscribe. `search` is None, 'random' or 'halving' over `param_spaces`
+    (defaults to default_param_spaces()). With `time_budget` seconds, candidates not
+    started before the budget runs out are skipped, and searches stop starting
+    new candidate batches; results[name]['search'] reports how many of the
+    planned search candidates were evaluated.
+    """
+    models = get_models(random_state=random_state)
+    spaces = default_param_spaces() if param_spaces is None else param_spaces
+    cores = (os.cpu_count() or 1) if n_jobs is None or n_jobs < 1 else n_jobs
+    outer = max(1, min(len(models), cores))
+    inner = max(1, cores // outer)
+    deadline = time.time() + time_budget if time_budget else None
+
+    jobs = (delayed(_fit_candidate)(name, m, X_train, y_train, X_test, y_test, search, spaces.get(name),
+                                    n_iter, inner, deadline, random_state)
+            for name, m in models.items())
+    with parallel_backend('loky', inner_max_num_threads=inner):
+        fitted = Parallel(n_jobs=outer)(jobs)
+
+    results = {name: res for name, res in fitted if res is not None}
+    skipped = [name for name, res in fitted if res is None]
+    if skipped:
+        warnings.warn(f"Time budget exhausted; skipped {', '.join(skipped)}")
+    cut = [f"{name} ({res['search']['evaluated']}/{res['search']['planned']} candidates)"
+           for name, res in results.items() if res['search'] and res['search']['cut_short']]
+    if cut:
+        warnings.warn(f"Time budget cut searches short: {', '.join(cut)}")
+    if not results:
+        raise RuntimeError('No model finished within the time budget.')
     # Select best by RMSE
     best_name = min(results.keys(), key=lambda k: results[k]['metrics']['rmse'])
     best_model = results[best_name]['model']
     return results, best_name, best_model
 
+class _NativeBooster:
+    """Stand-in for an XGBoost estimator saved next to the bundle in XGBoost's own format."""
+
+    def __init__(self, filename, estimator):
+        self.filename = filename
+        self.estimator = estimator
+
+def _is_xgboost(model):
+    return type(model).__module__.split('.')[0] == 'xgboost' and hasattr(model, 'save_model')
+
+def _library_versions():
+    import sys
+    versions = {'numpy': np.__version__, 'pandas': pd.__version__, 'joblib': joblib.__version__}
+    for name in ('sklearn', 'xgboost'):
+        if name in sys.modules:
+            versions[name] = sys.modules[name].__version__
+    return versions
+
+def _sidecars(path):
+    """XGBoost sidecar files written by save_model for `path`, current and stale."""
+    folder, base = os.path.split(path)
+    pattern = re.compile(re.escape(base) + r'(\.[0-9a-f]{16})?\.xgb\.ubj')
+    return [name for name in os.listdir(folder or '.') if pattern.fullmatch(name)]
+
 def save_model(model, path):
-    joblib.dump(model, path)
+    """Write a model bundle in the versioned artifact format.
+
+    The pickle is stored uncompressed so joblib lays NumPy arrays out in the
+    file and load_model(mmap_mode='r') can map them instead of reading them;
+    processes mapping the same file share those pages. An XGBoost model is
+    written beside the bundle as `<path>.<content hash>.xgb.ubj` in XGBoost's
+    native format; sidecars of earlier saves are removed once the new bundle
+    is in place. Anything that is not a {'model', 'artifacts'} dict is dumped as-is.
+    """
+    if not (isinstance(model, dict) and 'model' in model):
+        joblib.dump(model, path)
+        return
+    bundle = dict(model, format_version=ARTIFACT_FORMAT_VERSION, versions=_library_versions())
+    folder = os.path.dirname(path)
+    filename = None
+    # Write to temp files and rename, so a server that has the old file mapped never sees it truncated
+    if _is_xgboost(bundle['model']):
+        # A new name per content: the old bundle keeps pointing at its own sidecar until it is replaced
+        tmp = f'{path}.{uuid.uuid4().hex}.tmp.ubj'
+        bundle['model'].save_model(tmp)
+        with open(tmp, 'rb') as f:
+            digest = hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+        filename = f'{os.path.basename(path)}.{digest}.xgb.ubj'
+        os.replace(tmp, os.path.join(folder, filename))
+        bundle['model'] = _NativeBooster(filename, type(bundle['model']).__name__)
+    joblib.dump(bundle, path + '.tmp', compress=0)
+    os.replace(path + '.tmp', path)
+    for stale in _sidecars(path):
+        if stale != filename:
+            try:
+                os.remove(os.path.join(folder, stale))
+            except OSError:
+                pass
+
+@timed('load_model')
+def load_model(path, mmap_mode=None):
+    """Load a bundle written by save_model, or a plain joblib file from older versions.
+
+    With mmap_mode='r' large arrays are memory-mapped read-only. A bundle
+    whose format_version is unknown or newer than ARTIFACT_FORMAT_VERSION
+    raises ValueError.
+    """
+    obj = joblib.load(path, mmap_mode=mmap_mode)
+    version = obj.get('format_version') if isinstance(obj, dict) else None
+    if version is not None and (not isinstance(version, int) or not 1 <= version <= ARTIFACT_FORMAT_VERSION):
+        raise ValueError(f'{path} has bundle format_version {version!r}; this version reads up to '
+                         f'{ARTIFACT_FORMAT_VERSION}. Upgrade the package or retrain the model.')
+    if isinstance(obj, dict) and isinstance(obj.get('model'), _NativeBooster):
+        import xgboost
+        native = obj['model']
+        model = getattr(xgboost, native.estimator)()
+        model.load_model(os.path.join(os.path.dirname(path), native.filename))
+        obj['model'] = model
+    return obj
+
+def _iter_chunks(df_or_path, chunksize):
+    if isinstance(df_or_path, pd.DataFrame):
+        for start in range(0, len(df_or_path), chunksize):
+            yield df_or_path.iloc[start:start + chunksize]
+    else:
+        yield from read_csv_chunks(df_or_path, chunksize)
+
+@timed('score_chunk')
+def score_chunk(bundle, chunk, reference_date=None, id_cols=('video_id',), backend='auto', intervals=False,
+                explainer=None):
+    """Feature-engineer, transform and predict one chunk of raw rows in a single call.
+
+    `backend` picks the compiled tree engine or the native model (see src/tree_engine.py).
+    With `intervals`, an ensemble bundle also gets one column per quantile band
+    (e.g. predicted_ad_revenue_usd_p10); other models are unaffected. With an
+    `explainer` (src/explain.Explainer), SHAP values per input feature are
+    added as shap_<feature> columns plus shap_base_value.
+    """
+    artifacts = bundle['artifacts']
+    X = raw_to_model_matrix(chunk, artifacts, reference_date)
+    out = chunk[[c for c in id_cols if c in chunk.columns]].copy()
+    model = resolve_model(bundle, backend)
+    with timer('model_predict', model=type(model).__name__):
+        if intervals and hasattr(model, 'predict_intervals'):
+            result = model.predict_intervals(X)
+            out[PREDICTION_COL] = result['prediction']
+            for key in interval_keys(model):
+                out[f'{PREDICTION_COL}_{key}'] = result[key]
+        else:
+            out[PREDICTION_COL] = model.predict(X)
+    if explainer is not None:
+        contributions = group_by_input(explainer.explain(X), artifacts)
+        contributions.index = out.index
+        out = pd.concat([out, contributions.add_prefix(SHAP_PREFIX)], axis=1)
+    incr('rows_scored', len(out))
+    return out
+
+_worker_bundle = None
+_worker_explainer = None
+
+def _batch_explainer(bundle, n_jobs=1):
+    from src.prediction_cache import PredictionCache
+    return Explainer(bundle, cache=PredictionCache(EXPLAIN_CACHE_SIZE), n_jobs=n_jobs)
+
+def _init_worker(bundle_or_path, explain=False, explain_n_jobs=1):
+    global _worker_bundle, _worker_explainer
+    _worker_bundle = load_model(bundle_or_path, mmap_mode='r') if isinstance(bundle_or_path, str) else bundle_or_path
+    _worker_explainer = _batch_explainer(_worker_bundle, explain_n_jobs) if explain else None
+
+def _score_in_worker(chunk, reference_date, id_cols, backend, intervals):
+    return score_chunk(_worker_bundle, chunk, reference_date, id_cols, backend, intervals, _worker_explainer)
+
+def _scored_chunks(chunks, bundle, model_path, reference_date, id_cols, n_jobs, backend, intervals, explain,
+                   explain_n_jobs=1):
+    if n_jobs == 1:
+        # One explainer (and SHAP cache) for all chunks
+        explainer = _batch_explainer(bundle, explain_n_jobs) if explain else None
+        for chunk in chunks:
+            yield score_chunk(bundle, chunk, reference_date, id_cols, backend, intervals, explainer)
+        return
+    # Each worker loads the bundle once; at most 2 chunks per worker are in flight
+    # so memory stays bounded and results come back in input order.
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(model_path or bundle, explain, explain_n_jobs)) as pool:
+        window = []
+        for chunk in chunks:
+            window.append(pool.submit(_score_in_worker, chunk, reference_date, id_cols, backend, intervals))
+            if len(window) >= 2 * n_jobs:
+                yield window.pop(0).result()
+        for future in window:
+            yield future.result()
+
+class _ParquetSink:
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa, self._pq, self.path, self._writer = pa, pq, path, None
+
+    def write(self, df):
+        table = self._pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+class _CSVSink:
+    def __init__(self, path):
+        self.path, self._header = path, True
+
+    def write(self, df):
+        df.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        pass
+
+def predict_batch(df_or_path, bundle=None, model_path='models/best_model.joblib', out_path=None,
+                  chunksize=100_000, n_jobs=1, reference_date=None, id_cols=('video_id',), backend='auto',
+                  intervals=False, explain=False, explain_n_jobs=1):
+    """Score a DataFrame or a CSV shaped like examples/sample_input.csv in chunks.
 
-def load_model(path):
-    return joblib.load(path)
+    With `out_path` (.csv or .parquet) predictions are streamed to disk chunk by
+    chunk, so memory stays flat regardless of input size, and the path is
+    returned. Without it the predictions are returned as one DataFrame.
+    `n_jobs > 1` spreads chunks across a process pool. `backend` is 'auto',
+    'native' or 'compiled' (see src/tree_engine.resolve_model). `intervals`
+    adds the P10/P90 columns of an ensemble bundle (see src/ensemble.py) and
+    `explain` the SHAP values of every prediction (see src/explain.py), each
+    chunk split across `explain_n_jobs` threads (per worker process).
+    """
+    if bundle is None:
+        bundle = load_model(model_path, mmap_mode='r')
+    else:
+        model_path = None
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    chunks = _scored_chunks(_iter_chunks(df_or_path, chunksize), bundle, model_path, reference_date, tuple(id_cols),
+                            n_jobs, backend, intervals, explain, explain_n_jobs)
+    if out_path is None:
+        parts = list(chunks)
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=list(id_cols) + [PREDICTION_COL])
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    sink = _ParquetSink(out_path) if out_path.endswith('.parquet') else _CSVSink(out_path)
+    try:
+        for part in chunks:
+            sink.write(part)
+    finally:
+        sink.close()
+    return out_path
@@ -0,0 +1,83 @@
+# src/prediction_cache.py
+"""Bounded LRU/TTL memo of model predictions.
+
+Keys are a hash of the transformed feature vector plus a fingerprint of the
+model bundle, so a retrained models/best_model.joblib never serves stale
+predictions. Hit/miss counters show how many model evaluations were saved.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+def file_stamp(path):
+    """Cheap change detector for a bundle on disk: size and mtime (not a content hash,
+    unlike data_processing.file_fingerprint)."""
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+def row_keys(X, fingerprint):
+    """One digest per row of a DataFrame, ndarray or CSR matrix."""
+    from scipy import sparse as sp
+    salt = str(fingerprint).encode()
+    if sp.issparse(X):
+        X = X.tocsr()
+        keys = []
+        for i in range(X.shape[0]):
+            start, end = X.indptr[i], X.indptr[i + 1]
+            h = hashlib.blake2b(salt, digest_size=16)
+            h.update(X.indices[start:end].tobytes())
+            h.update(np.asarray(X.data[start:end], dtype=np.float64).tobytes())
+            keys.append(h.digest())
+        return keys
+    values = np.ascontiguousarray(np.asarray(X, dtype=np.float64))
+    return [hashlib.blake2b(salt + row.tobytes(), digest_size=16).digest() for row in values]
+
+class PredictionCache:
+    def __init__(self, maxsize=100_000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys):
+        """Return {index: prediction} for the keys that are cached and fresh."""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for i, k in enumerate(keys):
+                entry = self._data.get(k)
+                if entry is not None and (self.ttl is None or now - entry[1] < self.ttl):
+                    self._data.move_to_end(k)
+                    found[i] = entry[0]
+                elif entry is not None:
+                    del self._data[k]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, keys, values):
+        now = time.monotonic()
+        with self._lock:
+            for k, v in zip(keys, values):
+                self._data[k] = (v, now)
+                self._data.move_to_end(k)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'hit_rate': round(self.hits / total, 4) if total else None}
@@ -0,0 +1,75 @@
+# src/profiling.py
+"""Per-stage wall time and memory reporting for the training pipeline.
+
+    profiler = StageProfiler()
+    with profiler.stage('load_data'):
+        df = load_data(path)
+    print(profiler.format())
+
+Each stage records elapsed seconds, resident set size after the stage, the
+process peak RSS so far and, when tracemalloc is on, the peak bytes allocated
+inside the stage (NumPy and pandas buffers are included). Comparing a stage's
+allocation peak with the size of the frame shows how many times the data was
+materialized.
+"""
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _mb(n):
+    return None if n is None else round(n / 1e6, 1)
+
+class StageProfiler:
+    def __init__(self, trace_allocations=True):
+        self.trace_allocations = trace_allocations
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        started_tracing = False
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'stage': name, 'seconds': round(time.perf_counter() - start, 3)}
+            if self.trace_allocations:
+                record['alloc_peak_mb'] = _mb(tracemalloc.get_traced_memory()[1] - base)
+                if started_tracing:
+                    tracemalloc.stop()
+            record['rss_mb'] = _mb(current_rss_bytes())
+            record['peak_rss_mb'] = _mb(peak_rss_bytes())
+            self.stages.append(record)
+
+    def report(self):
+        return list(self.stages)
+
+    def format(self):
+        lines = [f"{'stage':<24}{'seconds':>10}{'alloc peak MB':>15}{'RSS MB':>10}{'peak RSS MB':>13}"]
+        for r in self.stages:
+            lines.append(f"{r['stage']:<24}{r['seconds']:>10}{str(r.get('alloc_peak_mb', '-')):>15}"
+                         f"{str(r['rss_mb']):>10}{str(r['peak_rss_mb']):>13}")
+        return '\n'.join(lines)
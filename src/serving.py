@@ -0,0 +1,381 @@
+# src/serving.py
+"""Resident predictor and a lightweight HTTP/JSON prediction server.
+
+Predictor loads the model bundle once and scores raw feature rows (the same
+fields the Streamlit app builds) in one vectorized call. MicroBatcher
+coalesces concurrent requests that arrive within a few milliseconds into a
+single model.predict. The server is stdlib-only (ThreadingHTTPServer):
+
+    POST /predict   {"rows": [{...}, ...]} or a single row object
+                    -> {"predictions": [...]}
+                    with "intervals": true an ensemble bundle also returns its
+                    quantile bands -> {"predictions": [...], "p10": [...], "p90": [...]}
+    GET  /metrics   latency percentiles and batch sizes as JSON
+    GET  /metrics/prometheus
+                    stage timers and counters (CMM_METRICS=1) in Prometheus text format
+    GET  /healthz   {"status": "ok"}
+
+Usage:
+    python serve.py --model models/best_model.joblib --port 8080
+"""
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from src.data_processing import raw_to_model_matrix
+from src.ensemble import interval_keys
+from src.explain import Explainer, group_by_input
+from src.modeling import load_model
+from src.prediction_cache import file_stamp, row_keys
+from src.instrumentation import incr, prometheus_text, timer
+from src.tree_engine import resolve_model
+
+INPUT_FIELDS = ['views', 'likes', 'comments', 'watch_time_minutes', 'video_length_minutes',
+                'subscribers', 'category', 'device', 'country', 'date']
+
+class LatencyStats:
+    """Rolling window of request latencies with percentile snapshots."""
+
+    def __init__(self, window=10_000):
+        self._samples = deque(maxlen=window)
+        self._batch_sizes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds, batch_size=None):
+        with self._lock:
+            self._samples.append(seconds)
+            if batch_size is not None:
+                self._batch_sizes.append(batch_size)
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = np.fromiter(self._samples, dtype=float)
+            batches = np.fromiter(self._batch_sizes, dtype=float)
+            count = self.count
+        if not len(samples):
+            return {'count': count}
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99]) * 1000
+        out = {'count': count, 'p50_ms': round(p50, 3), 'p90_ms': round(p90, 3), 'p99_ms': round(p99, 3),
+               'max_ms': round(samples.max() * 1000, 3)}
+        if len(batches):
+            out['mean_batch_size'] = round(batches.mean(), 2)
+        return out
+
+def rows_to_frame(rows):
+    df = pd.DataFrame.from_records(rows).reindex(columns=INPUT_FIELDS)
+    # Mixed tz-aware (YouTube publishedAt) and naive dates are normalized to naive UTC
+    df['date'] = pd.to_datetime(df['date'], utc=True, errors='coerce').dt.tz_localize(None)
+    return df
+
+class Predictor:
+    """Keeps a model bundle resident and scores raw rows in one call.
+
+    video_age_days is measured from `reference_date` (default: the bundle's
+    training reference date, as in predict_batch; today, UTC, for bundles
+    without one), so a row's prediction does not depend on which other rows
+    share its batch.
+    With a PredictionCache, rows whose transformed feature vector was already
+    scored by the same bundle skip model.predict. A bundle loaded from disk is
+    reloaded (and the cache cleared) when the file changes; the file is checked
+    at most every `reload_interval` seconds. `backend` selects the compiled
+    tree engine or the native model, as in predict_batch. explain_rows() memoizes
+    SHAP values in `explain_cache` the same way and splits large requests across
+    `explain_n_jobs` threads.
+    """
+
+    def __init__(self, bundle=None, model_path='models/best_model.joblib', reference_date=None,
+                 cache=None, reload_interval=2.0, backend='auto', explain_cache=None, explain_n_jobs=1):
+        self.model_path = model_path if bundle is None else None
+        self.backend = backend
+        self.reference_date = reference_date
+        self.cache = cache
+        self.explain_cache = explain_cache
+        self.explain_n_jobs = explain_n_jobs
+        self._explainer = None
+        self.reload_interval = reload_interval
+        self.latency = LatencyStats()
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        if bundle is None:
+            fingerprint = file_stamp(model_path)
+            bundle = load_model(model_path, mmap_mode='r')
+        else:
+            fingerprint = uuid.uuid4().hex
+        self._set_bundle(bundle, fingerprint)
+
+    def _set_bundle(self, bundle, fingerprint):
+        if not isinstance(bundle, dict) or bundle.get('model') is None or bundle.get('artifacts') is None:
+            raise ValueError('Model bundle appears incomplete (needs "model" and "artifacts").')
+        # One assignment, so readers see either the old bundle or the new one, never a mix
+        self._state = (bundle, resolve_model(bundle, self.backend), bundle['artifacts'], fingerprint)
+
+    def _maybe_reload(self):
+        if self.model_path is None or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                fingerprint = file_stamp(self.model_path)
+            except OSError:
+                return
+            if fingerprint != self.fingerprint:
+                self._set_bundle(load_model(self.model_path, mmap_mode='r'), fingerprint)
+                for cache in (self.cache, self.explain_cache):
+                    if cache is not None:
+                        cache.clear()
+
+    @property
+    def bundle(self):
+        return self._state[0]
+
+    @property
+    def model(self):
+        return self._state[1]
+
+    @property
+    def artifacts(self):
+        return self._state[2]
+
+    @property
+    def fingerprint(self):
+        return self._state[3]
+
+    @property
+    def feature_columns(self):
+        return self.artifacts['feature_columns']
+
+    def _predict_cached(self, predict, X, salt):
+        """predict(X) through the cache: one value (or row of values) per row of X."""
+        keys = row_keys(X, salt)
+        found = self.cache.get_many(keys)
+        incr('prediction_cache_hits', len(found))
+        incr('prediction_cache_misses', len(keys) - len(found))
+        values = [found.get(i) for i in range(len(keys))]
+        if len(found) < len(keys):
+            missing = np.array([i for i in range(len(keys)) if i not in found])
+            X_missing = X.iloc[missing] if isinstance(X, pd.DataFrame) else X[missing]
+            fresh = predict(X_missing)
+            for i, v in zip(missing, fresh):
+                values[i] = v
+            # A NaN band means the quantile model missed its budget; score that row again next time
+            keep = [j for j, v in enumerate(fresh) if not np.isnan(v).any()]
+            self.cache.set_many([keys[missing[j]] for j in keep], [fresh[j].tolist() for j in keep])
+        return np.asarray(values, dtype=float)
+
+    def _transform(self, df, artifacts):
+        return raw_to_model_matrix(df, artifacts, self.reference_date)
+
+    def predict_frame(self, df, intervals=False):
+        """Predictions for the rows of `df`.
+
+        With `intervals`, returns {'prediction': ..., 'p10': ..., 'p90': ...}
+        instead; the band keys are present only for ensemble bundles. Both
+        kinds of result are memoized in the prediction cache, under separate keys.
+        """
+        start = time.perf_counter()
+        self._maybe_reload()
+        # Read once so a concurrent reload cannot mix two bundles in one call
+        _, model, artifacts, fingerprint = self._state
+        X = self._transform(df, artifacts)
+        bands = interval_keys(model) if intervals else []
+        if bands:
+            def predict(X):
+                with timer('model_predict', model=type(model).__name__):
+                    result = model.predict_intervals(X)
+                return np.column_stack([result['prediction']] + [result[k] for k in bands])
+            salt = f'{fingerprint}-intervals'
+        else:
+            def predict(X):
+                with timer('model_predict', model=type(model).__name__):
+                    return np.asarray(model.predict(X), dtype=float)
+            salt = fingerprint
+        preds = self._predict_cached(predict, X, salt) if self.cache is not None else predict(X)
+        if bands:
+            preds = {'prediction': preds[:, 0], **{k: preds[:, j + 1] for j, k in enumerate(bands)}}
+        elif intervals:
+            preds = {'prediction': preds}
+        incr('rows_scored', len(df))
+        self.latency.record(time.perf_counter() - start, len(df))
+        return preds
+
+    def predict_rows(self, rows, intervals=False):
+        """One prediction per row; with `intervals`, one {'prediction', 'p10', 'p90'} dict per row."""
+        if not rows:
+            return []
+        preds = self.predict_frame(rows_to_frame(rows), intervals=intervals)
+        if not intervals:
+            return preds.tolist()
+        return [{k: (None if np.isnan(v) else float(v)) for k, v in zip(preds, values)} for values in zip(*preds.values())]
+
+    def _current_explainer(self):
+        bundle, _, _, fingerprint = self._state
+        current = self._explainer
+        if current is None or current[0] != fingerprint:
+            # Built on first use per bundle; TreeExplainer setup walks every tree
+            current = (fingerprint, Explainer(bundle, cache=self.explain_cache, n_jobs=self.explain_n_jobs,
+                                               fingerprint=fingerprint))
+            self._explainer = current
+        return current[1]
+
+    def explain_rows(self, rows):
+        """SHAP contribution of each input feature per row, plus 'base_value'; they sum to the prediction."""
+        if not rows:
+            return []
+        self._maybe_reload()
+        explainer = self._current_explainer()
+        X = self._transform(rows_to_frame(rows), explainer.artifacts)
+        return group_by_input(explainer.explain(X), explainer.artifacts).to_dict('records')
+
+def _columns_from_rows(preds):
+    # [{'prediction', 'p10', ...}, ...] -> {'predictions': [...], 'p10': [...], ...}
+    keys = list(preds[0]) if preds else ['prediction']
+    return {('predictions' if k == 'prediction' else k): [p[k] for p in preds] for k in keys}
+
+def _rows_from_columns(result):
+    keys = [k for k in result if k != 'predictions']
+    return [dict(prediction=v, **{k: result[k][i] for k in keys}) for i, v in enumerate(result['predictions'])]
+
+class RemotePredictor:
+    """Client for the prediction server with the same predict_rows interface."""
+
+    def __init__(self, url, timeout=10):
+        import requests
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def predict_rows(self, rows, intervals=False):
+        payload = [{k: (v.isoformat() if hasattr(v, 'isoformat') else v) for k, v in r.items()} for r in rows]
+        body = {'rows': payload, 'intervals': True} if intervals else {'rows': payload}
+        r = self._session.post(f'{self.url}/predict', json=body, timeout=self.timeout)
+        r.raise_for_status()
+        result = r.json()
+        if not intervals:
+            return result['predictions']
+        return _rows_from_columns(result)
+
+class MicroBatcher:
+    """Coalesces concurrent predict_rows calls into one model call.
+
+    The worker takes the first waiting request, then keeps collecting for up to
+    `max_wait_ms` or until `max_batch_size` rows are queued. Requests with and
+    without intervals in one batch are scored by one call each.
+    """
+
+    def __init__(self, predictor, max_batch_size=256, max_wait_ms=5.0):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def predict_rows(self, rows, intervals=False):
+        future = Future()
+        self._queue.put((rows, intervals, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            n_rows = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while n_rows < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                n_rows += len(item[0])
+            for intervals in (False, True):
+                group = [(req, future) for req, flag, future in batch if flag == intervals]
+                if group:
+                    self._score(group, intervals)
+
+    def _score(self, group, intervals):
+        rows = [r for req, _ in group for r in req]
+        try:
+            preds = self.predictor.predict_rows(rows, intervals=intervals)
+        except Exception as e:
+            for _, future in group:
+                future.set_exception(e)
+            return
+        offset = 0
+        for req, future in group:
+            future.set_result(preds[offset:offset + len(req)])
+            offset += len(req)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload, content_type='application/json'):
+        body = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/healthz':
+            self._send(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            predictor = self.server.predictor
+            metrics = {'requests': self.server.request_latency.snapshot(),
+                       'model_calls': predictor.latency.snapshot()}
+            if predictor.cache is not None:
+                metrics['prediction_cache'] = predictor.cache.stats()
+            self._send(200, metrics)
+        elif self.path == '/metrics/prometheus':
+            self._send(200, prometheus_text(), 'text/plain; version=0.0.4')
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send(404, {'error': 'not found'})
+            return
+        start = time.perf_counter()
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            # A scalar or list body falls through to the row check and gets a 400
+            batch = isinstance(payload, dict) and 'rows' in payload
+            rows = payload['rows'] if batch else [payload]
+            if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+                raise ValueError('expected a row object or {"rows": [...]}')
+            intervals = batch and bool(payload.get('intervals'))
+        except (ValueError, KeyError) as e:
+            self._send(400, {'error': str(e)})
+            return
+        try:
+            preds = self.server.batcher.predict_rows(rows, intervals=intervals)
+        except Exception as e:
+            self._send(500, {'error': f'prediction failed: {e}'})
+            return
+        self.server.request_latency.record(time.perf_counter() - start)
+        self._send(200, _columns_from_rows(preds) if intervals else {'predictions': preds})
+
+def make_server(predictor, host='127.0.0.1', port=8080, max_batch_size=256, max_wait_ms=5.0):
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.predictor = predictor
+    server.batcher = MicroBatcher(predictor, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    server.request_latency = LatencyStats()
+    return server
@@ -2,51 +2,203 @@
 # src/youtube_fetch.py
 import os
 import re
+import random
+import numpy as np
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import timedelta
-import isodate
-import json
-from time import time
+import threading
+import time
+from types import MappingProxyType
 
-CACHE_FILE = os.environ.get('YT_CACHE_FILE', 'data/yt_cache.json')
-os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+from src.yt_cache import open_cache, migrate_json_cache
+from src.instrumentation import incr, timed, timer
+
+# YT_CACHE_BACKEND selects the store: 'sqlite' (default) or the legacy 'json' file
+CACHE_BACKEND = os.environ.get('YT_CACHE_BACKEND', 'sqlite')
+LEGACY_CACHE_FILE = 'data/yt_cache.json'
+CACHE_FILE = os.environ.get('YT_CACHE_FILE', 'data/yt_cache.sqlite3' if CACHE_BACKEND == 'sqlite' else LEGACY_CACHE_FILE)
+CACHE_MAX_ENTRIES = int(os.environ.get('YT_CACHE_MAX_ENTRIES', '0')) or None
+os.makedirs(os.path.dirname(CACHE_FILE) or '.', exist_ok=True)
 
 YT_API_KEY = os.environ.get('YT_API_KEY')  # set this in env or Streamlit secrets
 
-VIDEO_DETAILS_URL = "https://www.googleapis.com/youtube/v3/videos"
-CHANNELS_URL = "https://www.googleapis.com/youtube/v3/channels"
-CATEGORIES_URL = "https://www.googleapis.com/youtube/v3/videoCategories"
+# Override YT_API_BASE to point the fetchers at a local stub server
+YT_API_BASE = os.environ.get('YT_API_BASE', 'https://www.googleapis.com/youtube/v3').rstrip('/')
+VIDEO_DETAILS_URL = f"{YT_API_BASE}/videos"
+CHANNELS_URL = f"{YT_API_BASE}/channels"
+CATEGORIES_URL = f"{YT_API_BASE}/videoCategories"
+
+# videos.list and channels.list accept at most 50 comma-separated ids per call
+MAX_IDS_PER_REQUEST = 50
+CACHE_TTL_SECONDS = 86400
+
+# Client-side throttling and retry policy for the Data API
+API_MAX_QPS = float(os.environ.get('YT_API_MAX_QPS', '20'))
+API_MAX_RETRIES = 5
+API_BACKOFF_BASE = 0.5
+API_BACKOFF_CAP = 30.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+HTTP_POOL_SIZE = 32
+
+# Regions whose category maps are fetched at warm start (YT_CATEGORY_REGIONS=US,IN,BR,...)
+CATEGORY_REGIONS = tuple(r.strip().upper() for r in os.environ.get('YT_CATEGORY_REGIONS', 'US').split(',') if r.strip())
+CATEGORY_REFRESH_RETRY_SECONDS = 300
+
+# Audience assumed for fetched videos unless the caller knows better
+DEFAULT_DEVICE = 'Mobile'
+DEFAULT_COUNTRY = 'US'
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                fresh = not os.path.exists(CACHE_FILE)
+                cache = open_cache(CACHE_BACKEND, CACHE_FILE, max_entries=CACHE_MAX_ENTRIES, default_ttl=CACHE_TTL_SECONDS)
+                # One-shot import of the old whole-file JSON cache into a new store
+                if fresh and CACHE_FILE != LEGACY_CACHE_FILE and os.path.exists(LEGACY_CACHE_FILE):
+                    migrate_json_cache(LEGACY_CACHE_FILE, cache, ttl=CACHE_TTL_SECONDS)
+                _cache = cache
+    return _cache
+
+class TokenBucket:
+    """Thread-safe token bucket: refills `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1.0):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
 
-def _load_cache():
+_session = None
+_session_lock = threading.Lock()
+_rate_limiter = TokenBucket(API_MAX_QPS)
+
+def _get_session():
+    # One keep-alive connection pool per process, shared by all fetcher threads
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+def _backoff_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(API_BACKOFF_CAP, float(retry_after))
+        except ValueError:
+            pass
+    # Full jitter: uniform in [0, base * 2**attempt], capped
+    return random.uniform(0, min(API_BACKOFF_CAP, API_BACKOFF_BASE * 2 ** attempt))
+
+def _get_json(url, params, timeout=10):
+    session = _get_session()
+    endpoint = url.rsplit('/', 1)[-1]
+    for attempt in range(API_MAX_RETRIES + 1):
+        with timer('yt_rate_limit_wait', endpoint=endpoint):
+            _rate_limiter.acquire()
+        incr('yt_api_calls', endpoint=endpoint)
+        try:
+            with timer('yt_api_request', endpoint=endpoint):
+                r = session.get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == API_MAX_RETRIES:
+                raise
+            incr('yt_api_retries', endpoint=endpoint, reason='connection')
+            time.sleep(_backoff_delay(attempt))
+            continue
+        if r.status_code in RETRY_STATUS and attempt < API_MAX_RETRIES:
+            incr('yt_api_retries', endpoint=endpoint, reason=str(r.status_code))
+            time.sleep(_backoff_delay(attempt, r.headers.get('Retry-After')))
+            continue
+        r.raise_for_status()
+        return r.json()
+
+# One alternation for every supported URL shape, plus a bare 11-character id.
+# Named groups and no lookarounds, so the same pattern runs under Arrow's RE2 engine.
+_VIDEO_ID_PATTERN = (r"(?:v=|youtu\.be/|youtube\.com/(?:embed|v)/)(?P<url>[A-Za-z0-9_-]{11})"
+                     r"|^(?P<bare>[A-Za-z0-9_-]{11})$")
+_VIDEO_ID_RE = re.compile(_VIDEO_ID_PATTERN)
+# PnW nD T nH nM nS, the forms YouTube returns; a bare "P" also matches and is rejected separately.
+# Anything else goes through isodate.
+_ISO_DURATION_PATTERN = ''.join(
+    ['^P'] + [rf"(?:(?P<{u}>\d+(?:[.,]\d+)?){u.upper()})?" for u in 'wd']
+    + ['(?:T'] + [rf"(?:(?P<{u}>\d+(?:[.,]\d+)?){u.upper()})?" for u in 'hms'] + [')?$']
+)
+_ISO_DURATION_RE = re.compile(_ISO_DURATION_PATTERN)
+_DURATION_UNIT_MINUTES = {'w': 7 * 24 * 60.0, 'd': 24 * 60.0, 'h': 60.0, 'm': 1.0, 's': 1 / 60.0}
+
+def _arrow_compute():
     try:
-        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
-        return {}
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        return pa, pc
+    except ImportError:
+        return None
 
-def _save_cache(cache):
-    with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
+def _string_values(values):
+    # Returns (list of str-or-None, index or None when the input was not a Series)
+    if isinstance(values, pd.Series):
+        return [v if isinstance(v, str) else None for v in values.tolist()], values.index
+    return [v if isinstance(v, str) else None for v in values], None
 
 def extract_video_id(url_or_id: str) -> str or None:
     s = (url_or_id or "").strip()
-    if not s:
+    m = _VIDEO_ID_RE.search(s)
+    if m is None:
         return None
-    patterns = [
-        r"v=([A-Za-z0-9_-]{11})",
-        r"youtu\\.be/([A-Za-z0-9_-]{11})",
-        r"youtube\\.com/embed/([A-Za-z0-9_-]{11})",
-        r"youtube\\.com/v/([A-Za-z0-9_-]{11})"
-    ]
-    for p in patterns:
-        m = re.search(p, s)
-        if m:
-            return m.group(1)
-    if re.fullmatch(r"[A-Za-z0-9_-]{11}", s):
-        return s
-    return None
+    return m.group('url') or m.group('bare')
 
-def parse_iso_duration_to_minutes(iso_duration: str) -> float or None:
+def extract_video_ids(urls_or_ids):
+    """Vectorized extract_video_id for a pandas Series or any iterable of strings.
+
+    Runs the one alternation regex over the whole column (in Arrow when
+    pyarrow is installed, else Series.str.extract). Returns a Series aligned
+    with an input Series (None where no id was found), or a list otherwise.
+    """
+    values, index = _string_values(urls_or_ids)
+    arrow = _arrow_compute()
+    if arrow is not None:
+        pa, pc = arrow
+        groups = pc.extract_regex(pc.utf8_trim_whitespace(pa.array(values, type=pa.string())), _VIDEO_ID_PATTERN)
+        url, bare = groups.field('url'), groups.field('bare')
+        ids = pc.if_else(pc.equal(url, ''), bare, url).to_pandas().to_numpy(dtype=object)
+        # Fields of a non-matching (null) struct read back as empty strings
+        ids[~groups.is_valid().to_numpy(zero_copy_only=False)] = None
+    else:
+        groups = pd.Series(values, dtype=object).str.strip().str.extract(_VIDEO_ID_PATTERN)
+        ids = groups['url'].where(groups['url'].notna(), groups['bare']).to_numpy(dtype=object)
+    ids[pd.isna(ids)] = None
+    return pd.Series(ids, index=index, dtype=object) if index is not None else ids.tolist()
+
+def _parse_iso_duration_isodate(iso_duration):
+    import isodate
     try:
         dur = isodate.parse_duration(iso_duration)
         if isinstance(dur, timedelta):
@@ -55,28 +207,67 @@ def parse_iso_duration_to_minutes(iso_duration: str) -> float or None:
         pass
     return None
 
-def fetch_video_metadata(video_id: str, api_key: str or None = None, use_cache=True) -> dict or None:
-    key = api_key or YT_API_KEY
-    if not key:
-        raise RuntimeError("YouTube API key not provided. Set YT_API_KEY environment variable or pass api_key.")
-    cache = _load_cache() if use_cache else {}
-    cache_key = f"video:{video_id}"
-    if use_cache and cache_key in cache:
-        meta = cache[cache_key]
-        if time() - meta.get('_fetched_at', 0) < 86400:
-            return meta['data']
-    params = {
-        "part": "snippet,contentDetails,statistics",
-        "id": video_id,
-        "key": key
-    }
-    r = requests.get(VIDEO_DETAILS_URL, params=params, timeout=10)
-    r.raise_for_status()
-    data = r.json()
-    items = data.get("items", [])
-    if not items:
+def parse_iso_duration_to_minutes(iso_duration: str) -> float or None:
+    m = _ISO_DURATION_RE.match(iso_duration) if isinstance(iso_duration, str) else None
+    if m is None:
+        return _parse_iso_duration_isodate(iso_duration)
+    parts = {u: v for u, v in m.groupdict().items() if v}
+    if not parts:
+        # 'P' or 'PT': the pattern matched but there is no component
         return None
-    it = items[0]
+    return sum(float(v.replace(',', '.')) * _DURATION_UNIT_MINUTES[u] for u, v in parts.items())
+
+def parse_iso_durations_to_minutes(iso_durations):
+    """Vectorized parse_iso_duration_to_minutes: float minutes, NaN where unparsable.
+
+    Takes a pandas Series (returns a Series with the same index) or any
+    iterable (returns a NumPy array). The rare strings outside the
+    PnWnDTnHnMnS form fall back to the per-item parser.
+    """
+    values, index = _string_values(iso_durations)
+    arrow = _arrow_compute()
+    minutes = np.zeros(len(values))
+    has_component = np.zeros(len(values), dtype=bool)
+    if arrow is not None:
+        pa, pc = arrow
+        groups = pc.extract_regex(pa.array(values, type=pa.string()), _ISO_DURATION_PATTERN)
+        matched = groups.is_valid().to_numpy(zero_copy_only=False)
+        for unit, factor in _DURATION_UNIT_MINUTES.items():
+            field = pc.fill_null(groups.field(unit), '')
+            present = pc.not_equal(field, '').to_numpy(zero_copy_only=False)
+            has_component |= present
+            if present.any():
+                field = pc.replace_substring(pc.if_else(pc.equal(field, ''), '0', field), ',', '.')
+                minutes += pc.cast(field, pa.float64()).to_numpy(zero_copy_only=False) * factor
+    else:
+        column = pd.Series(values, dtype=object)
+        groups = column.str.extract(_ISO_DURATION_PATTERN)
+        matched = column.str.match(_ISO_DURATION_PATTERN).to_numpy(dtype=bool, na_value=False)
+        for unit, factor in _DURATION_UNIT_MINUTES.items():
+            present = groups[unit].notna().to_numpy()
+            has_component |= present
+            if present.any():
+                field = groups[unit].str.replace(',', '.', regex=False)
+                minutes += pd.to_numeric(field, errors='coerce').fillna(0).to_numpy() * factor
+    # 'P' or 'PT' match the pattern without any component, like the scalar parser they give NaN
+    minutes[~matched | ~has_component] = np.nan
+    for i in np.flatnonzero(~matched):
+        if values[i] is not None:
+            parsed = _parse_iso_duration_isodate(values[i])
+            minutes[i] = np.nan if parsed is None else parsed
+    return pd.Series(minutes, index=index) if index is not None else minutes
+
+def _chunks(seq, size=MAX_IDS_PER_REQUEST):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+def _unique(ids):
+    return list(dict.fromkeys(i for i in ids if i))
+
+def _to_int(value):
+    return int(value) if value is not None else None
+
+def _parse_video_item(it: dict) -> dict:
     snippet = it.get("snippet", {})
     stats = it.get("statistics", {})
     content = it.get("contentDetails", {})
@@ -84,62 +275,108 @@ def fetch_video_metadata(video_id: str, api_key: str or None = None, use_cache=T
     duration_iso = content.get("duration")
     duration_minutes = parse_iso_duration_to_minutes(duration_iso) if duration_iso else None
 
-    meta = {
-        "video_id": video_id,
+    return {
+        "video_id": it.get("id"),
         "title": snippet.get("title"),
         "publishedAt": snippet.get("publishedAt"),
         "categoryId": snippet.get("categoryId"),
         "channelId": snippet.get("channelId"),
-        "viewCount": int(stats.get("viewCount", 0)) if stats.get("viewCount") is not None else None,
-        "likeCount": int(stats.get("likeCount", 0)) if stats.get("likeCount") is not None else None,
-        "commentCount": int(stats.get("commentCount", 0)) if stats.get("commentCount") is not None else None,
+        "viewCount": _to_int(stats.get("viewCount")),
+        "likeCount": _to_int(stats.get("likeCount")),
+        "commentCount": _to_int(stats.get("commentCount")),
         "duration_minutes": duration_minutes
     }
+
+def fetch_videos_metadata(video_ids, api_key: str or None = None, use_cache=True) -> dict:
+    """Fetch metadata for many videos, packing up to 50 ids into each videos.list call.
+
+    Returns {video_id: meta} with the same meta shape as fetch_video_metadata;
+    ids the API does not return (deleted/private videos) map to None.
+    """
+    key = api_key or YT_API_KEY
+    if not key:
+        raise RuntimeError("YouTube API key not provided. Set YT_API_KEY environment variable or pass api_key.")
+    ids = _unique(video_ids)
+    results = {}
     if use_cache:
-        cache[cache_key] = {'data': meta, '_fetched_at': time()}
-        _save_cache(cache)
-    return meta
+        with timer('yt_cache_read', kind='video'):
+            hits = _get_cache().get_many(f"video:{vid}" for vid in ids)
+        results = {k.split(':', 1)[1]: v for k, v in hits.items()}
+        incr('yt_cache_hits', len(results), kind='video')
+    misses = [vid for vid in ids if vid not in results]
+    incr('yt_cache_misses', len(misses), kind='video')
 
-def fetch_channel_subscribers(channel_id: str, api_key: str or None = None, use_cache=True) -> int or None:
+    fetched = {}
+    for batch in _chunks(misses):
+        params = {
+            "part": "snippet,contentDetails,statistics",
+            "id": ",".join(batch),
+            "key": key
+        }
+        for it in _get_json(VIDEO_DETAILS_URL, params).get("items", []):
+            meta = _parse_video_item(it)
+            results[meta["video_id"]] = meta
+            fetched[f"video:{meta['video_id']}"] = meta
+
+    if use_cache:
+        _get_cache().set_many(fetched, ttl=CACHE_TTL_SECONDS)
+    return {vid: results.get(vid) for vid in ids}
+
+def fetch_video_metadata(video_id: str, api_key: str or None = None, use_cache=True) -> dict or None:
+    return fetch_videos_metadata([video_id], api_key=api_key, use_cache=use_cache).get(video_id)
+
+def fetch_channels_subscribers(channel_ids, api_key: str or None = None, use_cache=True) -> dict:
+    """Fetch subscriber counts for many channels, up to 50 ids per channels.list call.
+
+    Returns {channel_id: subscriberCount}; unknown channels map to None.
+    """
     key = api_key or YT_API_KEY
     if not key:
         raise RuntimeError("YouTube API key not provided.")
-    cache = _load_cache() if use_cache else {}
-    cache_key = f"channel:{channel_id}"
-    if use_cache and cache_key in cache:
-        meta = cache[cache_key]
-        if time() - meta.get('_fetched_at', 0) < 86400:
-            return meta['data'].get('subscriberCount')
-    params = {
-        "part": "statistics",
-        "id": channel_id,
-        "key": key
-    }
-    r = requests.get(CHANNELS_URL, params=params, timeout=10)
-    r.raise_for_status()
-    data = r.json()
-    items = data.get("items", [])
-    if not items:
-        return None
-    stats = items[0].get("statistics", {})
-    subs = int(stats.get("subscriberCount", 0)) if stats.get("subscriberCount") is not None else None
+    ids = _unique(channel_ids)
+    results = {}
     if use_cache:
-        cache[cache_key] = {'data': {'subscriberCount': subs}, '_fetched_at': time()}
-        _save_cache(cache)
-    return subs
+        with timer('yt_cache_read', kind='channel'):
+            hits = _get_cache().get_many(f"channel:{cid}" for cid in ids)
+        results = {k.split(':', 1)[1]: v.get('subscriberCount') for k, v in hits.items()}
+        incr('yt_cache_hits', len(results), kind='channel')
+    misses = [cid for cid in ids if cid not in results]
+    incr('yt_cache_misses', len(misses), kind='channel')
+
+    fetched = {}
+    for batch in _chunks(misses):
+        params = {
+            "part": "statistics",
+            "id": ",".join(batch),
+            "key": key
+        }
+        for it in _get_json(CHANNELS_URL, params).get("items", []):
+            subs = _to_int(it.get("statistics", {}).get("subscriberCount"))
+            results[it.get("id")] = subs
+            fetched[f"channel:{it.get('id')}"] = {'subscriberCount': subs}
+
+    if use_cache:
+        _get_cache().set_many(fetched, ttl=CACHE_TTL_SECONDS)
+    return {cid: results.get(cid) for cid in ids}
+
+def fetch_channel_subscribers(channel_id: str, api_key: str or None = None, use_cache=True) -> int or None:
+    return fetch_channels_subscribers([channel_id], api_key=api_key, use_cache=use_cache).get(channel_id)
 
-def fetch_category_map(region_code='US', api_key: str or None = None, use_cache=True) -> dict:
+def fetch_category_map(region_code='US', api_key: str or None = None, use_cache=True, refresh=False) -> dict:
+    """{categoryId: title} for one region; `refresh` skips the cache read but still stores the result."""
     key = api_key or YT_API_KEY
     if not key:
         return {}
-    cache = _load_cache() if use_cache else {}
     cache_key = f"categories:{region_code}"
-    if use_cache and cache_key in cache and time() - cache[cache_key].get('_fetched_at', 0) < 86400:
-        return cache[cache_key]['data']
+    if use_cache and not refresh:
+        with timer('yt_cache_read', kind='categories'):
+            cached = _get_cache().get(cache_key)
+        if cached is not None:
+            incr('yt_cache_hits', kind='categories')
+            return cached
+    incr('yt_cache_misses', kind='categories')
     params = {"part": "snippet", "regionCode": region_code, "key": key}
-    r = requests.get(CATEGORIES_URL, params=params, timeout=10)
-    r.raise_for_status()
-    data = r.json()
+    data = _get_json(CATEGORIES_URL, params)
     items = data.get('items', [])
     mapping = {}
     for it in items:
@@ -148,11 +385,192 @@ def fetch_category_map(region_code='US', api_key: str or None = None, use_cache=
         if cid and title:
             mapping[cid] = title
     if use_cache:
-        cache[cache_key] = {'data': mapping, '_fetched_at': time()}
-        _save_cache(cache)
+        _get_cache().set(cache_key, mapping, ttl=CACHE_TTL_SECONDS)
     return mapping
 
-def build_feature_row_from_video(video_meta: dict, retention_rate: float = 0.30, category_map=None) -> dict:
+class CategoryMaps:
+    """Category maps for several regions, shared read-only by every thread of the process.
+
+    warm() fetches the configured regions in one concurrent burst. get() never
+    waits on the API for a region that is loaded: an expired map keeps being
+    served while a daemon thread refetches it (failed refreshes are retried
+    after CATEGORY_REFRESH_RETRY_SECONDS, whatever the error). Only a region
+    seen for the first time is fetched on the request path. Each map is an immutable
+    MappingProxyType and the region table is replaced as a whole, so
+    readers take no lock.
+    """
+
+    def __init__(self, regions=CATEGORY_REGIONS, api_key=None, ttl=CACHE_TTL_SECONDS, max_workers=8):
+        self.regions = tuple(regions)
+        self.api_key = api_key
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._maps = {}                 # region -> (mapping, monotonic expiry)
+        self._lock = threading.Lock()   # serializes writers only
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _load(self, regions, api_key=None, refresh=False):
+        key = api_key or self.api_key or YT_API_KEY
+        if not key or not regions:
+            return {}
+        loaded = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(regions))) as pool:
+            futures = {pool.submit(fetch_category_map, region, key, True, refresh): region for region in regions}
+            for future in as_completed(futures):
+                region = futures[future]
+                try:
+                    loaded[region] = future.result()
+                except requests.RequestException:
+                    incr('category_map_failures', region=region)
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            maps = dict(self._maps)
+            maps.update({region: (MappingProxyType(dict(m)), expires) for region, m in loaded.items() if m})
+            self._maps = maps
+        return loaded
+
+    @timed('category_maps_warm')
+    def warm(self, regions=None, api_key=None):
+        """Fetch `regions` (default: the configured ones) concurrently and start the refresher."""
+        self._remember_key(api_key)
+        self._load(tuple(regions or self.regions), api_key)
+        self._start_refresher()
+        return self
+
+    def _remember_key(self, api_key):
+        # The refresher has no caller to pass a key, so it uses the last one given
+        if api_key:
+            self.api_key = api_key
+
+    def get(self, region_code=DEFAULT_COUNTRY, api_key=None):
+        self._remember_key(api_key)
+        entry = self._maps.get(region_code)
+        if entry is None:
+            incr('category_map_misses', region=region_code)
+            self._load((region_code,), api_key)
+            self._start_refresher()
+            entry = self._maps.get(region_code)
+            return entry[0] if entry else {}
+        if entry[1] <= time.monotonic():
+            self._wakeup.set()
+        return entry[0]
+
+    def regions_loaded(self):
+        return sorted(self._maps)
+
+    def _start_refresher(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._refresh_loop, name='category-maps-refresh', daemon=True)
+                    self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            expired = [region for region, (_, expires) in self._maps.items() if expires <= now]
+            if expired:
+                try:
+                    loaded = self._load(expired, refresh=True)
+                except Exception:
+                    # Anything besides a request error (bad payload, a bug) must not end the thread
+                    incr('category_map_refresh_errors')
+                    loaded = {}
+                incr('category_map_refreshes', len(loaded))
+                failed = [region for region in expired if not loaded.get(region)]
+                if failed:
+                    # Keep serving the stale maps; try again later
+                    retry_at = time.monotonic() + CATEGORY_REFRESH_RETRY_SECONDS
+                    with self._lock:
+                        self._maps = {**self._maps, **{r: (self._maps[r][0], retry_at) for r in failed}}
+            next_expiry = min((expires for _, expires in self._maps.values()), default=None)
+            self._wakeup.wait(None if next_expiry is None else max(0.0, next_expiry - time.monotonic()))
+
+_category_maps = None
+_category_maps_lock = threading.Lock()
+
+def shared_category_maps(api_key=None):
+    """The process-wide CategoryMaps for CATEGORY_REGIONS, created (not warmed) on first use."""
+    global _category_maps
+    if _category_maps is None:
+        with _category_maps_lock:
+            if _category_maps is None:
+                _category_maps = CategoryMaps(api_key=api_key)
+    return _category_maps
+
+@timed('enrich_videos')
+def enrich_videos(video_ids, api_key: str or None = None, retention_rate: float = 0.30, region_code=DEFAULT_COUNTRY,
+                  max_workers=8, use_cache=True, device=DEFAULT_DEVICE, country=None) -> dict:
+    """Fetch videos, their channels and the category map concurrently.
+
+    Video ids are fetched in 50-id chunks on a thread pool; as soon as a chunk
+    arrives its unseen channel ids are queued, so channel lookups overlap with
+    the remaining video fetches. The category map of `region_code` comes from
+    the shared CategoryMaps (no API call once it is warm). `device` and
+    `country` (default: region_code) fill the audience fields of the feature
+    rows. Returns {video_id: {'meta', 'features'}}, with None for videos the
+    API did not return and for batches that still failed after retries
+    (counted as yt_enrich_failed_videos). Channel and category failures
+    degrade to 0 subscribers / raw category ids, as the app did before.
+    """
+    key = api_key or YT_API_KEY
+    if not key:
+        raise RuntimeError("YouTube API key not provided. Set YT_API_KEY environment variable or pass api_key.")
+    ids = _unique(video_ids)
+    metas = {}
+    subscribers = {}
+    seen_channels = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        if use_cache:
+            cat_future = pool.submit(shared_category_maps().get, region_code, key)
+        else:
+            cat_future = pool.submit(fetch_category_map, region_code, key, False)
+        pending = {pool.submit(fetch_videos_metadata, batch, key, use_cache): ('videos', batch) for batch in _chunks(ids)}
+        while pending:
+            # Handle every batch that finished since the last wakeup in one pass
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, batch = pending.pop(future)
+                if kind == 'channels':
+                    # Missing subscriber counts fall back to 0 rather than failing the batch
+                    try:
+                        subscribers.update(future.result())
+                    except requests.RequestException:
+                        pass
+                    continue
+                try:
+                    result = future.result()
+                except requests.RequestException:
+                    # One failed batch leaves its videos as None instead of discarding every other result
+                    incr('yt_enrich_failed_videos', len(batch))
+                    continue
+                metas.update(result)
+                channels = [m['channelId'] for m in result.values()
+                            if m and m.get('channelId') and m['channelId'] not in seen_channels]
+                seen_channels.update(channels)
+                for chunk in _chunks(channels):
+                    pending[pool.submit(fetch_channels_subscribers, chunk, key, use_cache)] = ('channels', chunk)
+        try:
+            cat_map = cat_future.result()
+        except requests.RequestException:
+            cat_map = {}
+
+    enriched = {}
+    for vid in ids:
+        meta = metas.get(vid)
+        if meta is None:
+            enriched[vid] = None
+            continue
+        row = build_feature_row_from_video(meta, retention_rate=retention_rate, category_map=cat_map, device=device,
+                                           country=country or region_code)
+        row['subscribers'] = subscribers.get(meta.get('channelId')) or 0
+        enriched[vid] = {'meta': meta, 'features': row}
+    return enriched
+
+def build_feature_row_from_video(video_meta: dict, retention_rate: float = 0.30, category_map=None,
+                                 device: str = DEFAULT_DEVICE, country: str = DEFAULT_COUNTRY) -> dict:
     v = video_meta or {}
     views = v.get("viewCount") or 0
     likes = v.get("likeCount") or 0
@@ -167,8 +585,6 @@ def build_feature_row_from_video(video_meta: dict, retention_rate: float = 0.30,
 
     cid = v.get('categoryId')
     category = (category_map.get(cid) if category_map and cid in category_map else f"cat_{cid}" ) if cid else "Unknown"
-    device = "Mobile"
-    country = "US"
 
     return {
         "video_id": v.get("video_id"),
@@ -0,0 +1,270 @@
+# src/yt_cache.py
+"""Pluggable on-disk key/value caches for YouTube API responses.
+
+SQLiteCache is the default backend: an indexed table in WAL mode, so a lookup
+costs one primary-key probe instead of parsing the whole cache, and several
+Streamlit sessions/processes can read and write concurrently. JSONFileCache
+keeps the legacy single-file format for environments without SQLite.
+
+Usage:
+    python src/yt_cache.py migrate data/yt_cache.json data/yt_cache.sqlite3
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from time import time
+
+DEFAULT_TTL_SECONDS = 86400
+
+class SQLiteCache:
+    """Key/value cache in a SQLite database with per-key TTL and LRU eviction.
+
+    Every process and thread gets its own connection; WAL mode lets readers
+    proceed while a writer commits, and each write is a single transaction.
+    """
+
+    def __init__(self, path, max_entries=None, default_ttl=DEFAULT_TTL_SECONDS, timeout=30.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.timeout = timeout
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " expires_at REAL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        conn = self._conn()
+        now = time()
+        found = {}
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({marks})"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (*batch, now),
+            ).fetchall()
+            for k, v in rows:
+                found[k] = json.loads(v)
+            if rows and self.max_entries:
+                hit = [k for k, _ in rows]
+                conn.execute(
+                    f"UPDATE cache SET last_access = ? WHERE key IN ({','.join('?' * len(hit))})",
+                    (now, *hit),
+                )
+        return found
+
+    def set(self, key, value, ttl=None, fetched_at=None):
+        self.set_many({key: value}, ttl=ttl, fetched_at=fetched_at)
+
+    def set_many(self, items, ttl=None, fetched_at=None):
+        if not items:
+            return
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time()
+        fetched_at = now if fetched_at is None else fetched_at
+        expires_at = fetched_at + ttl if ttl else None
+        rows = [(k, json.dumps(v, ensure_ascii=False), fetched_at, expires_at, now) for k, v in items.items()]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, fetched_at, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            if self.max_entries:
+                self._evict(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time(),))
+        (n,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if n > self.max_entries:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN"
+                " (SELECT key FROM cache ORDER BY last_access ASC LIMIT ?)",
+                (n - self.max_entries,),
+            )
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def purge_expired(self):
+        return self._conn().execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time(),)
+        ).rowcount
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+class JSONFileCache:
+    """Legacy single-file JSON cache ({key: {'data', '_fetched_at'}}).
+
+    The file is parsed once and re-read only when its mtime changes; writes go
+    to a temp file that is atomically renamed over the original.
+    """
+
+    def __init__(self, path, max_entries=None, default_ttl=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._data = {}
+        self._mtime = None
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+            self._mtime = mtime
+
+    def _alive(self, entry, now):
+        ttl = entry.get('_ttl', self.default_ttl)
+        return not ttl or now - entry.get('_fetched_at', 0) < ttl
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        with self._lock:
+            self._refresh()
+            now = time()
+            return {k: self._data[k]['data'] for k in keys if k in self._data and self._alive(self._data[k], now)}
+
+    def set(self, key, value, ttl=None, fetched_at=None):
+        self.set_many({key: value}, ttl=ttl, fetched_at=fetched_at)
+
+    def set_many(self, items, ttl=None, fetched_at=None):
+        if not items:
+            return
+        fetched_at = time() if fetched_at is None else fetched_at
+        with self._lock:
+            self._refresh()
+            for k, v in items.items():
+                entry = {'data': v, '_fetched_at': fetched_at}
+                if ttl is not None:
+                    entry['_ttl'] = ttl
+                self._data[k] = entry
+            if self.max_entries and len(self._data) > self.max_entries:
+                oldest = sorted(self._data, key=lambda k: self._data[k].get('_fetched_at', 0))
+                for k in oldest[:len(self._data) - self.max_entries]:
+                    del self._data[k]
+            self._write()
+
+    def _write(self):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def delete(self, key):
+        with self._lock:
+            self._refresh()
+            if self._data.pop(key, None) is not None:
+                self._write()
+
+    def purge_expired(self):
+        with self._lock:
+            self._refresh()
+            now = time()
+            dead = [k for k, e in self._data.items() if not self._alive(e, now)]
+            for k in dead:
+                del self._data[k]
+            if dead:
+                self._write()
+            return len(dead)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._data)
+
+BACKENDS = {'sqlite': SQLiteCache, 'json': JSONFileCache}
+
+def open_cache(backend='sqlite', path=None, **kwargs):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown cache backend {backend!r}; expected one of {sorted(BACKENDS)}")
+    if path is None:
+        path = 'data/yt_cache.sqlite3' if backend == 'sqlite' else 'data/yt_cache.json'
+    return BACKENDS[backend](path, **kwargs)
+
+def migrate_json_cache(json_path, cache, ttl=DEFAULT_TTL_SECONDS):
+    """Import a legacy JSON cache file into `cache`, keeping original fetch times."""
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    by_time = {}
+    for key, entry in legacy.items():
+        if isinstance(entry, dict) and 'data' in entry:
+            by_time.setdefault(entry.get('_fetched_at', 0), {})[key] = entry['data']
+    for fetched_at, items in by_time.items():
+        cache.set_many(items, ttl=ttl, fetched_at=fetched_at)
+    return sum(len(items) for items in by_time.values())
+
+def main():
+    p = argparse.ArgumentParser(description='YouTube API cache maintenance')
+    sub = p.add_subparsers(dest='cmd', required=True)
+    m = sub.add_parser('migrate', help='Import a legacy JSON cache into a SQLite cache')
+    m.add_argument('json_path', nargs='?', default='data/yt_cache.json')
+    m.add_argument('db_path', nargs='?', default='data/yt_cache.sqlite3')
+    g = sub.add_parser('purge', help='Delete expired entries')
+    g.add_argument('db_path', nargs='?', default='data/yt_cache.sqlite3')
+    args = p.parse_args()
+    cache = SQLiteCache(args.db_path)
+    if args.cmd == 'migrate':
+        print('Imported', migrate_json_cache(args.json_path, cache), 'entries into', args.db_path)
+    else:
+        print('Purged', cache.purge_expired(), 'expired entries from', args.db_path)
+
+if __name__ == '__main__':
+    main()
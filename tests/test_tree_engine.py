@@ -0,0 +1,77 @@
+"""Parity of CompiledForest with the native predict of the models it compiles."""
+import numpy as np
+import pytest
+from scipy import sparse as sp
+
+from src.tree_engine import PARITY_ATOL, PARITY_RTOL, compile_model
+
+N_FEATURES = 8
+
+def _data(rows=400, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, N_FEATURES)).astype(np.float32)
+    # Mostly-zero columns, so CSR inputs actually leave entries out
+    X[:, -3:] *= rng.random((rows, 3)) < 0.2
+    y = X[:, 0] * 3 + np.sin(X[:, 1]) + X[:, 2] * X[:, 3] + rng.normal(0, 0.1, rows)
+    return X, y
+
+def _with_nan(X, seed=1):
+    X = X.copy()
+    mask = np.random.default_rng(seed).random(X.shape) < 0.1
+    X[mask] = np.nan
+    X[0] = np.nan
+    return X
+
+def _assert_parity(engine, model, X):
+    np.testing.assert_allclose(engine.predict(X), model.predict(X), rtol=PARITY_RTOL, atol=PARITY_ATOL)
+
+def _random_forest(X, y):
+    from sklearn.ensemble import RandomForestRegressor
+    return RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0).fit(X, y)
+
+def _xgboost(X, y, **params):
+    xgboost = pytest.importorskip('xgboost')
+    return xgboost.XGBRegressor(n_estimators=30, max_depth=4, **params).fit(X, y)
+
+@pytest.mark.parametrize('fit', [_random_forest, _xgboost], ids=['RandomForest', 'XGBoost'])
+def test_dense_parity(fit):
+    X, y = _data()
+    model = fit(X, y)
+    _assert_parity(compile_model(model), model, X)
+    _assert_parity(compile_model(model), model, X[:1])
+
+@pytest.mark.parametrize('fit', [_random_forest, _xgboost], ids=['RandomForest', 'XGBoost'])
+def test_csr_parity(fit):
+    X, y = _data()
+    model = fit(X, y)
+    X_csr = sp.csr_matrix(X)
+    assert X_csr.nnz < X.size
+    _assert_parity(compile_model(model), model, X_csr)
+
+def test_random_forest_nan_rows():
+    X, y = _data()
+    X_nan = _with_nan(X)
+    try:
+        model = _random_forest(X_nan, y)
+    except ValueError:
+        pytest.skip('this scikit-learn version has no missing-value support in RandomForest')
+    _assert_parity(compile_model(model), model, X_nan)
+
+def test_xgboost_nan_rows():
+    X, y = _data()
+    X_nan = _with_nan(X)
+    model = _xgboost(X_nan, y)
+    _assert_parity(compile_model(model), model, X_nan)
+    # NaNs stored explicitly in a CSR matrix, next to entries left out of it
+    _assert_parity(compile_model(model), model, sp.csr_matrix(X_nan))
+
+def test_xgboost_best_iteration_truncation():
+    X, y = _data(rows=600)
+    X_val, y_val = _data(rows=200, seed=2)
+    xgboost = pytest.importorskip('xgboost')
+    model = xgboost.XGBRegressor(n_estimators=300, max_depth=4, learning_rate=0.5, early_stopping_rounds=5)
+    model.fit(X, y, eval_set=[(X_val, y_val)], verbose=False)
+    engine = compile_model(model)
+    assert model.best_iteration + 1 < model.get_booster().num_boosted_rounds()
+    assert engine.n_trees == model.best_iteration + 1
+    _assert_parity(engine, model, X_val)